@@ -1,13 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import traceback
 import os
 from datetime import datetime
 import csv
+import json
 import re
 
 # Import our chat system
-from chat import get_chat_response, save_lead, is_business_email
+from chat import get_chat_response, stream_chat_response, save_lead, is_business_email, get_kb_retriever, is_ready, warmup_status, start_warmup
+from memory_report import process_memory
+from simple_retriever import simple_rag
 
 app = Flask(__name__)
 
@@ -33,26 +36,30 @@ def home():
         "version": "2.0",
         "endpoints": {
             "/chat": "POST - Chat with the bot",
+            "/chat/stream": "POST - Chat with the answer streamed as server-sent events",
             "/save_lead": "POST - Save lead information",
-            "/health": "GET - Health check"
+            "/admin/reload-kb": "POST - Re-index knowledgebase.txt (X-Admin-Key)",
+            "/health": "GET - Health check (liveness)",
+            "/ready": "GET - Readiness check, 200 once retrieval is warm"
         },
         "timestamp": datetime.now().isoformat()
     })
 
+def _request_message():
+    """The chat message from form data or JSON, or None"""
+    if request.form.get('message'):
+        return request.form.get('message')
+    if request.is_json:
+        return (request.get_json(silent=True) or {}).get("message")
+    return None
+
 @app.route("/chat", methods=["POST"])
 def chat():
     """Main chat endpoint"""
     try:
         print("📨 Received chat request")
 
-        message = None
-        
-        # Get message from form data or JSON
-        if request.form.get('message'):
-            message = request.form.get('message')
-        elif request.is_json:
-            data = request.get_json()
-            message = data.get("message")
+        message = _request_message()
 
         if not message:
             return jsonify({"error": "No message provided"}), 400
@@ -87,6 +94,37 @@ def chat():
             "show_options": False
         }), 500
 
+def _sse(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Chat endpoint that streams the answer as it is generated.
+
+    Sends `token` events ({"text": ...}) while the model writes, then one
+    `done` event with the full response and the show_demo_popup/show_options
+    flags, exactly as /chat returns them.
+    """
+    print("📨 Received streaming chat request")
+    message = _request_message()
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    print(f"💬 User message: {message[:100]}...")
+
+    def events():
+        # Sent at once so the browser sees the stream open before retrieval runs
+        yield ": stream open\n\n"
+        for event, data in stream_chat_response(message):
+            yield _sse(event, {"text": data} if event == "token" else data)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Keep nginx-style proxies from buffering the stream
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route("/save_lead", methods=["POST"])
 def save_lead_route():
     """Save lead information"""
@@ -134,14 +172,48 @@ def save_lead_route():
             "message": "Error saving your information. Please try again."
         }), 500
 
+@app.route("/admin/reload-kb", methods=["POST"])
+def reload_kb():
+    """Re-index knowledgebase.txt in this worker (others pick it up via the file watcher)"""
+    admin_key = os.environ.get("ADMIN_KEY")
+    if not admin_key or request.headers.get("X-Admin-Key") != admin_key:
+        return jsonify({"error": "Valid admin key required"}), 401
+
+    try:
+        summary = get_kb_retriever().reload()
+        return jsonify({"success": True, **summary})
+    except Exception as e:
+        print(f"❌ Error reloading knowledgebase: {str(e)}")
+        return jsonify({"success": False, "message": "Reload failed, previous index kept"}), 500
+
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check endpoint"""
-    return jsonify({
+    """Liveness check: answers as soon as the process is up, never waits on the model"""
+    data = {
         "status": "healthy",
         "service": "OnPalms Chatbot API",
+        "memory": process_memory(),
         "timestamp": datetime.now().isoformat()
-    })
+    }
+    if is_ready():
+        try:
+            data.update(get_kb_retriever().stats())
+        except Exception as e:
+            data["retrieval_error"] = str(e)
+    if simple_rag.last_attempt:
+        data["website_content"] = simple_rag.stats()
+    return jsonify(data)
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check: 200 only once the retriever is loaded and warm in this worker"""
+    start_warmup()
+    status = warmup_status()
+    return jsonify({
+        "status": "ready" if status["ready"] else status["status"],
+        "warmup": status,
+        "timestamp": datetime.now().isoformat()
+    }), 200 if status["ready"] else 503
 
 if __name__ == "__main__":
     # Run the app
@@ -149,4 +221,5 @@ if __name__ == "__main__":
     debug = os.environ.get("DEBUG", "False").lower() == "true"
     
     print(f"🚀 Starting OnPalms Chatbot API on port {port}")
+    start_warmup()
     app.run(host="0.0.0.0", port=port, debug=debug)
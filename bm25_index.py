@@ -0,0 +1,72 @@
+"""
+Precomputed BM25 inverted index for keyword retrieval
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "that", "the",
+    "this", "to", "we", "what", "with", "you", "your"
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, so product terms like 3PL, FEFO and RFID survive intact"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents.
+
+    Documents are tokenized once at build time into postings lists of
+    (doc_id, term frequency) with precomputed document lengths and IDF, so a
+    query only touches the postings of its own terms.
+    """
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+
+        self.postings = dict(self.postings)
+        n_docs = len(self.doc_lengths)
+        self.avg_doc_length = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        # Per-document length normalisation term, computed once instead of per posting
+        self._norm = [
+            k1 * (1 - b + b * (length / self.avg_doc_length if self.avg_doc_length else 0.0))
+            for length in self.doc_lengths
+        ]
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document that matches at least one query term"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in postings:
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self._norm[doc_id])
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Return up to top_k (doc_id, score) pairs, best first"""
+        scores = self.scores(query)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
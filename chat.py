@@ -2,21 +2,104 @@
 import os
 import time
 import hashlib
-import openai
+import threading
 from dotenv import load_dotenv
 from simple_retriever import retrieve
+from chunker import count_tokens
 import traceback
 import csv
 import re
 
 load_dotenv()
 
-# Initialize OpenAI with the older API format (compatible with openai==0.28.1)
-openai.api_key = os.getenv("OPENAI_API_KEY")
+_openai = None
 
-# Initialize the knowledge base retriever
-from kb_retriever import KnowledgebaseRetriever
-kb_retriever = KnowledgebaseRetriever(os.path.join(os.path.dirname(__file__), "knowledgebase.txt"))
+def _get_openai():
+    """Import and configure the OpenAI client on first use (openai==0.28.1 API)"""
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        _openai = openai
+    return _openai
+
+# The knowledge base retriever pulls in torch and the embedding model, so it is
+# built by warmup() instead of at import time; /ready reports when it is warm
+KB_PATH = os.path.join(os.path.dirname(__file__), "knowledgebase.txt")
+KB_READY_TIMEOUT = float(os.getenv("KB_READY_TIMEOUT", "60"))
+# When set, retrieval is served by kb_daemon.py over this Unix socket instead of in-process
+KB_DAEMON_SOCKET = os.getenv("KB_DAEMON_SOCKET")
+
+kb_retriever = None
+_kb_lock = threading.Lock()
+_kb_ready = threading.Event()
+_warmup_state = {"status": "cold", "error": None, "seconds": None, "pid": None}
+
+def warmup(probe=True):
+    """Build the retriever if needed and, with probe, run one query so the first request is warm.
+
+    The gunicorn master calls this with probe=False when preloading, so the
+    model and any already cached vectors are shared with the workers without
+    running inference before fork.
+    """
+    global kb_retriever
+    start = time.time()
+    _warmup_state["pid"] = os.getpid()
+    _warmup_state["status"] = "loading"
+    try:
+        with _kb_lock:
+            if kb_retriever is None:
+                if KB_DAEMON_SOCKET:
+                    # The retrieval daemon owns the model; this process only holds a client
+                    from kb_daemon import RemoteRetriever
+                    kb_retriever = RemoteRetriever(KB_DAEMON_SOCKET)
+                else:
+                    from kb_retriever import create_retriever
+                    # Without probe (the gunicorn master) nothing is encoded: a
+                    # cold or changed embedding cache is filled by the workers
+                    kb_retriever = create_retriever(KB_PATH, encode_missing=probe)
+        if probe:
+            kb_retriever.warm()
+            _kb_ready.set()
+        _warmup_state["status"] = "ready" if probe else "loaded"
+    except Exception as e:
+        _warmup_state["status"] = "failed"
+        _warmup_state["error"] = str(e)
+        print(f"❌ Knowledge base warmup failed: {str(e)}")
+        print(traceback.format_exc())
+    finally:
+        _warmup_state["seconds"] = round(time.time() - start, 2)
+        print(f"🔥 Knowledge base warmup {_warmup_state['status']} in {_warmup_state['seconds']}s")
+
+def start_warmup():
+    """Run warmup() in a background thread, once per process"""
+    # Skip if this process already warmed up or is doing so; a master-loaded
+    # ("loaded") or failed warmup still needs a run here
+    if _warmup_state["pid"] == os.getpid() and _warmup_state["status"] in ("loading", "ready"):
+        return
+    _warmup_state["pid"] = os.getpid()
+    _warmup_state["status"] = "loading"
+    threading.Thread(target=warmup, name="kb-warmup", daemon=True).start()
+
+def is_ready():
+    """True once retrieval is warm in this process"""
+    return _kb_ready.is_set()
+
+def warmup_status():
+    return {**_warmup_state, "ready": is_ready()}
+
+def get_kb_retriever(timeout=KB_READY_TIMEOUT):
+    """Return the warm retriever, starting warmup if needed and waiting up to timeout seconds"""
+    start_warmup()
+    if not _kb_ready.wait(timeout):
+        raise RuntimeError("Knowledge base is still loading")
+    return kb_retriever
+
+# Token budget for the knowledgebase context pasted into the system prompt
+CONTEXT_MAX_TOKENS = int(os.getenv("KB_CONTEXT_MAX_TOKENS", "600"))
+
+# Seconds between checks of knowledgebase.txt for hot reloads (0 disables)
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "5"))
 
 _response_cache = {}
 CACHE_MAX_SIZE = 100
@@ -181,8 +264,13 @@ def is_business_email(email):
 
 def generate_context_from_query(user_input: str) -> str:
     """Generate relevant context for the user query using RAG"""
+    retriever = get_kb_retriever()
+
+    # Started on first use so the watcher thread lives in the serving worker
+    retriever.start_watching(KB_WATCH_INTERVAL)
+
     # Retrieve relevant sections from knowledgebase
-    context = kb_retriever.retrieve_relevant_context(user_input, top_k=3)
+    context = retriever.retrieve_relevant_context(user_input, top_k=3, max_tokens=CONTEXT_MAX_TOKENS)
     
     # Add any specific product mentions
     product_mentions = []
@@ -194,54 +282,58 @@ def generate_context_from_query(user_input: str) -> str:
     if product_mentions:
         context = "Specifically mentioned products:\n" + "\n".join(product_mentions) + "\n\n" + context
     
-    print(f"📚 Retrieved context length: {len(context)} characters")
+    print(f"📚 Retrieved context length: {len(context)} characters, {count_tokens(context)} tokens")
     return context
 
-def get_chat_response(user_input, extra_context=''):
-    """Main chat response function with enhanced context handling and validation"""
-    try:
-        # Detect greetings and demo requests first
-        greetings = ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"]
-        is_greeting = any(greet in user_input.lower() for greet in greetings)
-        wants_demo = detect_demo_request(user_input)
+CHAT_MODEL = "gpt-4-0125-preview"
 
-        # Handle greetings
-        if is_greeting:
-            return {
-                'response': "Welcome to PALMS™, your warehouse management expert. What specific challenges can I help you address?",
-                'show_demo_popup': False,
-                'show_options': False
-            }
-        
-        # Handle demo requests
-        if wants_demo:
-            return {
-                'response': "I'll arrange a personalized demo of PALMS™ for your warehouse needs. Please fill out this quick form to proceed.",
-                'show_demo_popup': True,
-                'show_options': False
-            }
-        
-        # Check if query is too complex or requires detailed explanation
-        complex_keywords = ['how', 'explain', 'details', 'features', 'benefits', 'compare', 'difference', 'pricing', 'cost']
-        is_complex_query = any(keyword in user_input.lower() for keyword in complex_keywords)
-        
-        if is_complex_query:
-            return {
-                'response': "Your question requires a detailed explanation of our solutions. Would you like to schedule a demo for a comprehensive overview?",
-                'show_demo_popup': True,
-                'show_options': False
-            }
-        
-        # Generate context using RAG
-        context = generate_context_from_query(user_input)
-        print(f"📝 Generated context length: {len(context)} characters")
+def _canned_response(user_input):
+    """Answer greetings, demo requests and complex questions without the model; None otherwise"""
+    # Detect greetings and demo requests first
+    greetings = ["hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening"]
+    is_greeting = any(greet in user_input.lower() for greet in greetings)
+    wants_demo = detect_demo_request(user_input)
 
-        if extra_context:
-            context = f"{context}\n\nAdditional Context:\n{extra_context}"
-            print(f"📝 Final context with extra information: {len(context)} characters")
-        
-        # Create system message with context
-        system_msg = f"""You are PALMS™ Bot - a warehouse management expert. Use this context to answer accurately:
+    # Handle greetings
+    if is_greeting:
+        return {
+            'response': "Welcome to PALMS™, your warehouse management expert. What specific challenges can I help you address?",
+            'show_demo_popup': False,
+            'show_options': False
+        }
+    
+    # Handle demo requests
+    if wants_demo:
+        return {
+            'response': "I'll arrange a personalized demo of PALMS™ for your warehouse needs. Please fill out this quick form to proceed.",
+            'show_demo_popup': True,
+            'show_options': False
+        }
+    
+    # Check if query is too complex or requires detailed explanation
+    complex_keywords = ['how', 'explain', 'details', 'features', 'benefits', 'compare', 'difference', 'pricing', 'cost']
+    is_complex_query = any(keyword in user_input.lower() for keyword in complex_keywords)
+    
+    if is_complex_query:
+        return {
+            'response': "Your question requires a detailed explanation of our solutions. Would you like to schedule a demo for a comprehensive overview?",
+            'show_demo_popup': True,
+            'show_options': False
+        }
+    return None
+
+def _build_messages(user_input, extra_context=''):
+    """Retrieve context and build the chat messages; returns (messages, context)"""
+    # Generate context using RAG
+    context = generate_context_from_query(user_input)
+    print(f"📝 Generated context length: {len(context)} characters")
+
+    if extra_context:
+        context = f"{context}\n\nAdditional Context:\n{extra_context}"
+        print(f"📝 Final context with extra information: {len(context)} characters")
+    
+    # Create system message with context
+    system_msg = f"""You are PALMS™ Bot - a warehouse management expert. Use this context to answer accurately:
 
 {context}
 
@@ -253,15 +345,87 @@ CRITICAL RULES:
 3. For pricing/implementation questions, suggest contacting sales
 4. Keep responses concise and focused"""
 
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": user_input}
-        ]
+    messages = [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_input}
+    ]
+    return messages, context
+
+def _error_response(e, user_input, context=None):
+    """Log a failed chat turn and map the error to a visitor-facing response"""
+    print("=" * 50)
+    print("🔴 ERROR DETAILS")
+    print("=" * 50)
+    print(f"Error Type: {type(e).__name__}")
+    print(f"Error Message: {str(e)}")
+    print(f"User Input: {user_input}")
+    print("-" * 50)
+    print("Context:")
+    print(context if context else "No context available")
+    print("-" * 50)
+    print("Full Traceback:")
+    print(traceback.format_exc())
+    print("=" * 50)
+
+    openai = _get_openai()
+    if isinstance(e, openai.error.AuthenticationError):
+        return {
+            'response': "There seems to be an issue with the API configuration. The team has been notified.",
+            'show_demo_popup': False,
+            'show_options': False
+        }
+    elif isinstance(e, openai.error.APIError):
+        return {
+            'response': "Our AI service is temporarily unavailable. Please try again in a moment.",
+            'show_demo_popup': False,
+            'show_options': False
+        }
+    elif isinstance(e, openai.error.Timeout):
+        return {
+            'response': "The request took too long to process. Please try a simpler question.",
+            'show_demo_popup': False,
+            'show_options': False
+        }
+    else:
+        error_type = type(e).__name__
+        print(f"⚠️ Unhandled error type: {error_type}")
+        
+        # More specific error messages based on error type
+        if "Context" in str(e) or "content" in str(e).lower():
+            return {
+                'response': "I'm having trouble processing the product information. Could you please ask about a specific PALMS™ feature or product?",
+                'show_demo_popup': False,
+                'show_options': True
+            }
+        elif "rate" in str(e).lower() or "limit" in str(e).lower():
+            return {
+                'response': "Our system is experiencing high demand. Please try again in a moment.",
+                'show_demo_popup': False,
+                'show_options': False
+            }
+        else:
+            # More informative general fallback
+            top_product = next(iter(PALMS_PRODUCTS.items()))
+            return {
+                'response': f"While I'm addressing your question, let me tell you about our flagship product:\n\nPALMS™ {top_product[0]}: {top_product[1]}\n\nWould you like to know more about this or our other solutions?",
+                'show_demo_popup': False,
+                'show_options': True
+            }
+
+def get_chat_response(user_input, extra_context=''):
+    """Main chat response function with enhanced context handling and validation"""
+    context = None
+    try:
+        canned = _canned_response(user_input)
+        if canned:
+            return canned
+        
+        messages, context = _build_messages(user_input, extra_context)
         
         # Get response from OpenAI
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4-0125-preview",
+            response = _get_openai().ChatCompletion.create(
+                model=CHAT_MODEL,
                 messages=messages,
                 max_tokens=200,
                 temperature=0.7
@@ -280,63 +444,51 @@ CRITICAL RULES:
             raise openai_error
         
     except Exception as e:
-        print("=" * 50)
-        print("🔴 ERROR DETAILS")
-        print("=" * 50)
-        print(f"Error Type: {type(e).__name__}")
-        print(f"Error Message: {str(e)}")
-        print(f"User Input: {user_input}")
-        print("-" * 50)
-        print("Context:")
-        print(context if context else "No context available")
-        print("-" * 50)
-        print("Full Traceback:")
-        print(traceback.format_exc())
-        print("=" * 50)
+        return _error_response(e, user_input, context)
 
-        if isinstance(e, openai.error.AuthenticationError):
-            return {
-                'response': "There seems to be an issue with the API configuration. The team has been notified.",
-                'show_demo_popup': False,
-                'show_options': False
-            }
-        elif isinstance(e, openai.error.APIError):
-            return {
-                'response': "Our AI service is temporarily unavailable. Please try again in a moment.",
-                'show_demo_popup': False,
-                'show_options': False
-            }
-        elif isinstance(e, openai.error.Timeout):
-            return {
-                'response': "The request took too long to process. Please try a simpler question.",
-                'show_demo_popup': False,
-                'show_options': False
-            }
-        else:
-            error_type = type(e).__name__
-            print(f"⚠️ Unhandled error type: {error_type}")
-            
-            # More specific error messages based on error type
-            if "Context" in str(e) or "content" in str(e).lower():
-                return {
-                    'response': "I'm having trouble processing the product information. Could you please ask about a specific PALMS™ feature or product?",
-                    'show_demo_popup': False,
-                    'show_options': True
-                }
-            elif "rate" in str(e).lower() or "limit" in str(e).lower():
-                return {
-                    'response': "Our system is experiencing high demand. Please try again in a moment.",
-                    'show_demo_popup': False,
-                    'show_options': False
-                }
-            else:
-                # More informative general fallback
-                top_product = next(iter(PALMS_PRODUCTS.items()))
-                return {
-                    'response': f"While I'm addressing your question, let me tell you about our flagship product:\n\nPALMS™ {top_product[0]}: {top_product[1]}\n\nWould you like to know more about this or our other solutions?",
-                    'show_demo_popup': False,
-                    'show_options': True
-                }
+def stream_chat_response(user_input, extra_context=''):
+    """Yield ('token', text) as the model writes the answer, then one ('done', result).
+
+    result is the dict get_chat_response would return: the full response and
+    the show_demo_popup/show_options flags. Canned answers yield only 'done'.
+    On an error, 'done' carries the error message as the response, which
+    replaces any partial text already sent.
+    """
+    context = None
+    try:
+        canned = _canned_response(user_input)
+        if canned:
+            yield 'done', canned
+            return
+        
+        messages, context = _build_messages(user_input, extra_context)
+        
+        start = time.time()
+        parts = []
+        for chunk in _get_openai().ChatCompletion.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            max_tokens=200,
+            temperature=0.7,
+            stream=True
+        ):
+            text = chunk.choices[0].delta.get("content")
+            if not text:
+                continue
+            if not parts:
+                print(f"⚡ First token after {time.time() - start:.2f}s")
+            parts.append(text)
+            yield 'token', text
+        
+        answer = ''.join(parts).strip()
+        print(f"📝 AI response: {answer[:100]}... ({time.time() - start:.2f}s)")
+        yield 'done', {
+            'response': answer,
+            'show_demo_popup': False,
+            'show_options': True
+        }
+    except Exception as e:
+        yield 'done', _error_response(e, user_input, context)
 
 if __name__ == "__main__":
     # Test the chat system
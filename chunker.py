@@ -0,0 +1,135 @@
+"""
+Token-bounded chunking of markdown knowledgebase text
+"""
+import re
+from typing import Dict, List
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)$')
+TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Token count in the units the LLM is billed in.
+
+    Uses tiktoken's cl100k_base encoding (gpt-4) when it is installed and falls
+    back to counting words and punctuation marks, which tracks BPE counts
+    closely enough for budgeting.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(TOKEN_RE.findall(text))
+
+def split_sections(content: str) -> List[Dict]:
+    """Split markdown into heading-delimited sections with their heading path"""
+    sections = []
+    path: List[str] = []
+    current = None
+
+    for line in content.split('\n'):
+        match = HEADING_RE.match(line)
+        if match:
+            level = len(match.group(1))
+            path = path[:level - 1] + [''] * max(0, level - 1 - len(path)) + [match.group(2).strip()]
+            current = {'heading': line, 'path': ' > '.join(p for p in path if p), 'lines': []}
+            sections.append(current)
+        else:
+            if current is None:
+                current = {'heading': '', 'path': '', 'lines': []}
+                sections.append(current)
+            current['lines'].append(line)
+
+    return sections
+
+def _split_long_line(line: str, max_tokens: int) -> List[str]:
+    """Break a single line that exceeds the budget into word windows"""
+    pieces, current = [], []
+    for word in line.split(' '):
+        if current and count_tokens(' '.join(current + [word])) > max_tokens:
+            pieces.append(' '.join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(' '.join(current))
+    return pieces
+
+def _window_lines(heading: str, lines: List[str], max_tokens: int, overlap: int) -> List[str]:
+    """Pack body lines into windows of at most max_tokens, repeating the heading
+    at the top of each window and carrying ~overlap tokens of trailing lines over"""
+    heading_tokens = count_tokens(heading) if heading else 0
+    budget = max(1, max_tokens - heading_tokens)
+
+    units = []
+    for line in lines:
+        units.extend(_split_long_line(line, budget) if count_tokens(line) > budget else [line])
+
+    windows, current, current_tokens = [], [], 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if current and current_tokens + tokens > budget:
+            windows.append(current)
+            # Seed the next window with trailing lines from this one
+            carried, carried_tokens = [], 0
+            for prev in reversed(current):
+                prev_tokens = count_tokens(prev)
+                if carried_tokens + prev_tokens > overlap or carried_tokens + prev_tokens + tokens > budget:
+                    break
+                carried.insert(0, prev)
+                carried_tokens += prev_tokens
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        windows.append(current)
+
+    return ['\n'.join(([heading] if heading else []) + window) for window in windows]
+
+def chunk_markdown(content: str, max_tokens: int = 256, overlap: int = 32, min_tokens: int = 24) -> List[Dict]:
+    """Split markdown into chunks of at most max_tokens that never cross a heading.
+
+    Sections that fit the budget become one chunk; larger ones are windowed
+    line by line with ~overlap tokens repeated between neighbours. Sections
+    with less than min_tokens of body (bare parent headings, short stubs) are
+    folded into the following section instead of taking an index slot.
+
+    Each chunk is a dict with 'text', 'tokens', 'section' (heading path),
+    'section_id' (index of the parent section) and 'chunk' (position within it).
+    """
+    chunks = []
+    pending = ''
+
+    sections = split_sections(content)
+    for section_id, section in enumerate(sections):
+        body = '\n'.join(section['lines']).strip()
+        heading = (pending + '\n' + section['heading']).strip() if pending else section['heading']
+        pending = ''
+
+        if count_tokens(body) < min_tokens and section_id < len(sections) - 1:
+            # Too small to stand alone: carry heading and body into the next section
+            pending = '\n'.join(part for part in (heading, body) if part)
+            if count_tokens(pending) <= max_tokens // 2:
+                continue
+            heading, body, pending = pending, '', ''
+
+        if not body and not heading:
+            continue
+
+        lines = [line for line in body.split('\n') if line.strip()]
+        texts = _window_lines(heading, lines, max_tokens, overlap) if lines else [heading]
+        for position, text in enumerate(texts):
+            chunks.append({
+                'text': text,
+                'tokens': count_tokens(text),
+                'section': section['path'],
+                'section_id': section_id,
+                'chunk': position
+            })
+
+    return chunks
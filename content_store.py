@@ -0,0 +1,117 @@
+"""
+Durable SQLite store of fetched and cleaned WordPress documents
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers may refresh concurrently
+    fcntl = None
+
+DEFAULT_CONTENT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.kb_cache', 'wp_content.sqlite3')
+
+DocId = Tuple[str, int]
+
+class ContentStore:
+    """Cleaned documents keyed by (content_type, id) plus the sync state.
+
+    The database runs in WAL mode, so every worker on the host can read it
+    while one of them writes a refresh. Each call opens its own short-lived
+    connection, which keeps the store safe to use from refresh threads and
+    across fork.
+    """
+
+    def __init__(self, path: str = DEFAULT_CONTENT_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                content_type TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                modified_gmt TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (content_type, id))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_modified ON documents (modified_gmt)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        """One connection and transaction, committed on success and always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load_meta(self) -> Dict[str, str]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT name, value FROM meta"))
+
+    def load_documents(self, modified_since: Optional[str] = None) -> Dict[DocId, Dict]:
+        """Every document, or only those with modified_gmt >= modified_since"""
+        query = "SELECT content_type, id, key, modified_gmt, text FROM documents"
+        args = ()
+        if modified_since:
+            query += " WHERE modified_gmt >= ?"
+            args = (modified_since,)
+        with self._connect() as conn:
+            return {
+                (content_type, doc_id): {"key": key, "text": text, "modified_gmt": modified_gmt}
+                for content_type, doc_id, key, modified_gmt, text in conn.execute(query, args)
+            }
+
+    def save(self, documents: Dict[DocId, Dict], meta: Dict[str, str], replace: bool = False):
+        """Upsert documents and meta in one transaction; replace drops every other document first"""
+        with self._connect() as conn:
+            if replace:
+                conn.execute("DELETE FROM documents")
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (content_type, id, key, modified_gmt, text) VALUES (?, ?, ?, ?, ?)",
+                [(content_type, doc_id, doc["key"], doc["modified_gmt"], doc["text"])
+                 for (content_type, doc_id), doc in documents.items()]
+            )
+            conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                             [(name, str(value)) for name, value in meta.items()])
+
+    def refresh_lock(self, blocking: bool = True) -> '_RefreshLock':
+        """Host-wide lock so only one process refreshes the store at a time"""
+        return _RefreshLock(f"{self.path}.lock", blocking)
+
+class _RefreshLock:
+    """flock on a file next to the database; `acquired` is False only if non-blocking and busy.
+
+    Like the embedding cache lock, a lock file that cannot be opened means
+    running unlocked rather than not running.
+    """
+
+    def __init__(self, path: str, blocking: bool):
+        self.path = path
+        self.blocking = blocking
+        self.handle = None
+        self.acquired = False
+
+    def __enter__(self):
+        if fcntl is None:
+            self.acquired = True
+            return self
+        try:
+            self.handle = open(self.path, 'w')
+            fcntl.flock(self.handle, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.acquired = True
+        except OSError as e:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+            self.acquired = not isinstance(e, BlockingIOError)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
@@ -0,0 +1,108 @@
+"""
+Query-aware extractive compression of retrieved knowledgebase chunks
+"""
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chunker import HEADING_RE, count_tokens
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9])')
+# Joins the compressed chunks in the prompt context, so its tokens count against the budget
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+def split_units(text: str) -> List[Dict]:
+    """Split chunk text into heading lines and sentence units.
+
+    Every bullet or list line is one unit and prose lines are split into
+    sentences. Each unit remembers its line so kept units can be put back
+    in their original layout.
+    """
+    units = []
+    for line_no, line in enumerate(text.split('\n')):
+        if not line.strip():
+            continue
+        if HEADING_RE.match(line):
+            units.append({'text': line, 'line': line_no, 'heading': True})
+            continue
+        indent = line[:len(line) - len(line.lstrip())]
+        for position, sentence in enumerate(SENTENCE_RE.split(line.strip())):
+            units.append({'text': (indent if position == 0 else '') + sentence, 'line': line_no, 'heading': False})
+    return units
+
+class SentenceIndex:
+    """Sentence units of every chunk with their token counts and (once set) vectors.
+
+    Built alongside the chunk index; the retriever encodes `encode_texts`
+    through the embedding cache and assigns the normalized matrix to
+    `embeddings`, so compressing a request is one small matrix-vector product.
+    """
+
+    def __init__(self, chunks: List[Dict]):
+        self.units: List[Dict] = []
+        self.ranges: List[range] = []
+        self.encode_texts: List[str] = []
+
+        for chunk in chunks:
+            start = len(self.units)
+            for unit in split_units(chunk['text']):
+                unit['tokens'] = count_tokens(unit['text'])
+                self.units.append(unit)
+                if not unit['heading']:
+                    # The heading path gives bare bullets like "Custom reporting" their context
+                    prefix = f"{chunk['section']}: " if chunk['section'] else ''
+                    self.encode_texts.append(prefix + unit['text'].strip())
+            self.ranges.append(range(start, len(self.units)))
+
+        # Row of each non-heading unit in the embedding matrix (-1 for headings)
+        self.rows = np.full(len(self.units), -1, dtype=np.int64)
+        body = [i for i, unit in enumerate(self.units) if not unit['heading']]
+        self.rows[body] = np.arange(len(body))
+        self.embeddings: Optional[np.ndarray] = None
+
+    def compress(self, query_vector: np.ndarray, chunk_ids: List[int], max_tokens: int,
+                 separator: str = CHUNK_SEPARATOR) -> List[str]:
+        """Keep the sentences of chunk_ids most similar to the query within max_tokens.
+
+        Sentences are taken greedily by cosine to the query; the first one kept
+        from a chunk also brings in that chunk's heading lines and, after the
+        first chunk, the separator the caller joins chunks with. Kept text is
+        returned per chunk in the original order, and chunks with nothing kept
+        are left out.
+        """
+        candidates = [i for chunk_id in chunk_ids for i in self.ranges[chunk_id] if not self.units[i]['heading']]
+        if not candidates:
+            return []
+        scores = np.asarray(self.embeddings[self.rows[candidates]], dtype=np.float32) @ query_vector
+        owner = {i: chunk_id for chunk_id in chunk_ids for i in self.ranges[chunk_id]}
+
+        separator_tokens = count_tokens(separator)
+        kept, opened, used = set(), set(), 0
+        for position in np.argsort(-scores):
+            unit_id = candidates[position]
+            chunk_id = owner[unit_id]
+            cost = self.units[unit_id]['tokens']
+            headings = []
+            if chunk_id not in opened:
+                headings = [i for i in self.ranges[chunk_id] if self.units[i]['heading']]
+                cost += sum(self.units[i]['tokens'] for i in headings)
+                if opened:
+                    cost += separator_tokens
+            if used + cost > max_tokens:
+                continue
+            kept.add(unit_id)
+            kept.update(headings)
+            opened.add(chunk_id)
+            used += cost
+
+        compressed = []
+        for chunk_id in chunk_ids:
+            if chunk_id not in opened:
+                continue
+            lines: Dict[int, List[str]] = {}
+            for i in self.ranges[chunk_id]:
+                if i in kept:
+                    lines.setdefault(self.units[i]['line'], []).append(self.units[i]['text'])
+            compressed.append('\n'.join(' '.join(parts) for _, parts in sorted(lines.items())))
+        return compressed
@@ -0,0 +1,328 @@
+"""
+Offline build of one retrieval index over every content source
+
+Chunks knowledgebase.txt, the WordPress pages/posts and a folder of PDFs,
+embeds the chunks in batches and writes a versioned artifact: a JSON list of
+chunks with their source metadata, the normalized float32 vectors as .npy,
+and a manifest naming both. Pointing KB_INDEX_PATH at the output directory
+makes the retriever memory-map the artifact read-only, so one search covers
+every source and the web app never encodes documents.
+
+Usage:
+    python corpus_index.py build [--output .kb_index] [--pdf-dir docs] [--no-wordpress] [--batch-size 64]
+    python corpus_index.py info [--output .kb_index]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunker import chunk_markdown
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.kb_index')
+KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledgebase.txt')
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+
+class CorpusIndex:
+    """A loaded artifact: chunks with their 'source' dicts, the chunk matrix and
+    (when built with --sentences) the sentence-unit matrix, both memory-mapped"""
+
+    def __init__(self, manifest: Dict, chunks: List[Dict], embeddings: np.ndarray,
+                 sentence_embeddings: Optional[np.ndarray] = None):
+        self.manifest = manifest
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.sentence_embeddings = sentence_embeddings
+
+    @property
+    def version(self) -> str:
+        return self.manifest['version']
+
+    @property
+    def model(self) -> str:
+        return self.manifest['model']
+
+    def describe(self) -> str:
+        sources = ', '.join(f"{count} {name}" for name, count in self.manifest['sources'].items())
+        return f"{len(self.chunks)} chunks ({sources}), built {self.manifest['built_at']}"
+
+def read_manifest(index_dir: str) -> Optional[Dict]:
+    """The current manifest, or None if nothing usable has been built there"""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('format') == FORMAT_VERSION else None
+
+def load_corpus(index_dir: str) -> CorpusIndex:
+    """Open the current artifact read-only; raises if it is missing or inconsistent"""
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No index built in {index_dir}; run `python corpus_index.py build` first")
+    with open(os.path.join(index_dir, manifest['chunks']), 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    embeddings = np.load(os.path.join(index_dir, manifest['embeddings']), mmap_mode='r')
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(chunks):
+        raise ValueError(f"Index {manifest['version']} has {len(chunks)} chunks but {embeddings.shape[0]} vectors")
+    sentence_embeddings = None
+    if manifest.get('sentences'):
+        sentence_embeddings = np.load(os.path.join(index_dir, manifest['sentences']), mmap_mode='r')
+    return CorpusIndex(manifest, chunks, embeddings, sentence_embeddings)
+
+def _save_array(index_dir: str, filename: str, matrix: np.ndarray):
+    # Per-process temp name first, like the embedding cache, so readers never see a partial file
+    path = os.path.join(index_dir, filename)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+def write_corpus(index_dir: str, manifest: Dict, chunks: List[Dict], embeddings: np.ndarray,
+                 sentence_embeddings: Optional[np.ndarray] = None) -> Dict:
+    """Write one version's files, then swap the manifest in as the atomic commit point.
+
+    manifest must carry 'version'; the file names are filled in here. Files of
+    every version other than this one and the one it replaces are removed
+    (processes still mapping them keep them alive on POSIX).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    previous = read_manifest(index_dir)
+    version = manifest['version']
+
+    manifest = {**manifest, 'format': FORMAT_VERSION, 'chunks': f"chunks-{version}.json",
+                'embeddings': f"corpus-{version}.npy", 'sentences': None}
+    _save_array(index_dir, manifest['embeddings'], embeddings)
+    if sentence_embeddings is not None:
+        manifest['sentences'] = f"sentences-{version}.npy"
+        _save_array(index_dir, manifest['sentences'], sentence_embeddings)
+
+    chunks_path = os.path.join(index_dir, manifest['chunks'])
+    with open(f"{chunks_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(chunks, f, ensure_ascii=False)
+    os.replace(f"{chunks_path}.{os.getpid()}.tmp", chunks_path)
+
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    with open(f"{manifest_path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{manifest_path}.{os.getpid()}.tmp", manifest_path)
+
+    keep = {version, previous['version'] if previous else version}
+    for name in os.listdir(index_dir):
+        stem = os.path.splitext(name)[0]
+        if stem.startswith(('chunks-', 'corpus-', 'sentences-')) and stem.split('-', 1)[1] not in keep:
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass
+    return manifest
+
+# ---------------------------------------------------------------- sources
+
+def _chunk(markdown: str, source: Dict, max_tokens: int, overlap: int) -> List[Dict]:
+    chunks = chunk_markdown(markdown, max_tokens=max_tokens, overlap=overlap)
+    for chunk in chunks:
+        chunk['source'] = source
+    return chunks
+
+def knowledgebase_chunks(path: str, max_tokens: int, overlap: int) -> List[Dict]:
+    """The markdown knowledgebase, chunked exactly as the in-process retriever does"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return _chunk(content, {'type': 'knowledgebase', 'path': os.path.basename(path)}, max_tokens, overlap)
+
+def wordpress_chunks(documents: Dict[Tuple[str, int], Dict], max_tokens: int, overlap: int) -> List[Dict]:
+    """Cleaned pages/posts from SimpleRAG; each document's first line (its title) becomes the heading"""
+    chunks = []
+    for (content_type, doc_id), doc in sorted(documents.items()):
+        # Same cut as the website keyword index: skip near-empty pages
+        if not doc['text'] or len(doc['text']) <= 50:
+            continue
+        source = {'type': 'wordpress', 'content_type': content_type, 'id': doc_id,
+                  'modified_gmt': doc['modified_gmt']}
+        chunks.extend(_chunk(f"# {doc['text']}", source, max_tokens, overlap))
+    return chunks
+
+def pdf_chunks(folder: str, max_tokens: int, overlap: int) -> List[Dict]:
+    """Text of every PDF under folder, chunked page by page so each chunk cites its page"""
+    try:
+        import pdfplumber
+    except ImportError:
+        raise ImportError("PDF ingestion needs 'pdfplumber' installed")
+
+    paths = sorted(
+        os.path.join(root, name) for root, _, names in os.walk(folder)
+        for name in names if name.lower().endswith('.pdf')
+    )
+    chunks = []
+    for path in paths:
+        title = os.path.splitext(os.path.basename(path))[0].replace('_', ' ')
+        try:
+            with pdfplumber.open(path) as pdf:
+                pages = [page.extract_text() or '' for page in pdf.pages]
+        except Exception as e:
+            print(f"⚠️ Skipping unreadable PDF {path}: {str(e)}")
+            continue
+        for number, text in enumerate(pages, 1):
+            # Drop leading '#' so a PDF line is never mistaken for a markdown heading
+            lines = [' '.join(line.split()).lstrip('#').strip() for line in text.split('\n')]
+            body = '\n'.join(line for line in lines if line)
+            if not body:
+                continue
+            source = {'type': 'pdf', 'path': os.path.relpath(path, folder), 'page': number}
+            chunks.extend(_chunk(f"# {title} (page {number})\n{body}", source, max_tokens, overlap))
+        print(f"📄 {os.path.relpath(path, folder)}: {len(pages)} pages")
+    return chunks
+
+# ---------------------------------------------------------------- build
+
+def embed_in_batches(encoder, texts: List[str], previous_hashes: Optional[List[str]],
+                     previous_matrix: Optional[np.ndarray], batch_size: int, label: str,
+                     dim: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """Return (hashes, matrix) for texts, copying rows whose hash the previous build already
+    encoded and encoding the rest batch_size texts at a time"""
+    from kb_retriever import EmbeddingCache
+
+    hashes = [EmbeddingCache.section_hash(encoder.cache_key, text) for text in texts]
+    previous_rows = {h: i for i, h in enumerate(previous_hashes or [])}
+    missing = [i for i, h in enumerate(hashes) if h not in previous_rows]
+
+    if dim is None:
+        dim = previous_matrix.shape[1] if previous_matrix is not None else None
+    matrix = np.empty((len(texts), dim), dtype=np.float32) if dim is not None else None
+    start = time.perf_counter()
+    for offset in range(0, len(missing), batch_size):
+        batch = missing[offset:offset + batch_size]
+        vectors = encoder.encode([texts[i] for i in batch], batch_size=batch_size)
+        if matrix is None:
+            matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        matrix[batch] = vectors
+        done = offset + len(batch)
+        if done == len(missing) or (offset // batch_size) % 20 == 19:
+            print(f"🧮 {label}: {done}/{len(missing)} encoded ({time.perf_counter() - start:.1f}s)")
+
+    for i, h in enumerate(hashes):
+        if h in previous_rows:
+            matrix[i] = previous_matrix[previous_rows[h]]
+    print(f"🧮 {label}: encoded {len(missing)} new/changed texts, reused {len(texts) - len(missing)}")
+    return hashes, matrix
+
+def build(index_dir: str, knowledgebase_path: Optional[str] = KB_PATH, wordpress: bool = True,
+          wordpress_url: Optional[str] = None, pdf_dir: Optional[str] = None, batch_size: int = 64,
+          sentences: bool = False) -> Dict:
+    """Build and publish a new artifact from the selected sources; returns its manifest"""
+    from context_compressor import SentenceIndex
+    from encoders import create_encoder
+    from kb_retriever import DEFAULT_CACHE_DIR, DEFAULT_MODEL_NAME
+
+    start = time.perf_counter()
+    max_tokens = int(os.getenv('KB_CHUNK_MAX_TOKENS', '256'))
+    overlap = int(os.getenv('KB_CHUNK_OVERLAP', '32'))
+
+    chunks: List[Dict] = []
+    if knowledgebase_path:
+        chunks.extend(knowledgebase_chunks(knowledgebase_path, max_tokens, overlap))
+    if wordpress:
+        from simple_retriever import SimpleRAG
+        from wp_fetcher import DEFAULT_BASE_URL
+        app_site = os.getenv("WP_BASE_URL", DEFAULT_BASE_URL).rstrip('/')
+        site = (wordpress_url or app_site).rstrip('/')
+        # The app's shared content store only serves its own site; any other site
+        # is synced fresh in memory so it neither reads nor replaces that store
+        rag = SimpleRAG(site, store_path=None if site == app_site else '')
+        documents = rag.load_fresh()
+        if not documents:
+            # Publishing without the website would silently drop it from answers
+            raise RuntimeError("No WordPress content could be fetched; rerun later or pass --no-wordpress")
+        chunks.extend(wordpress_chunks(documents, max_tokens, overlap))
+    if pdf_dir:
+        chunks.extend(pdf_chunks(pdf_dir, max_tokens, overlap))
+    if not chunks:
+        raise ValueError("No content to index")
+
+    sources: Dict[str, int] = {}
+    for chunk in chunks:
+        sources[chunk['source']['type']] = sources.get(chunk['source']['type'], 0) + 1
+    print(f"📚 {len(chunks)} chunks: {sources}")
+
+    # Same model and backend settings as the web app, so query vectors land in the same space
+    model_name = os.getenv('KB_MODEL_NAME', DEFAULT_MODEL_NAME)
+    encoder = create_encoder(os.getenv('KB_ENCODER_BACKEND', 'torch'), model_name,
+                             os.getenv('KB_EMBEDDING_CACHE_DIR', DEFAULT_CACHE_DIR))
+    print(f"🧠 Encoder: {encoder.describe()}")
+
+    previous = None
+    manifest = read_manifest(index_dir)
+    if manifest is not None and manifest['model'] == encoder.cache_key:
+        try:
+            previous = load_corpus(index_dir)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Previous index unusable, encoding everything: {str(e)}")
+
+    hashes, embeddings = embed_in_batches(
+        encoder, [chunk['text'] for chunk in chunks],
+        previous.manifest['hashes'] if previous else None,
+        previous.embeddings if previous else None, batch_size, 'chunks')
+
+    sentence_hashes, sentence_embeddings = [], None
+    if sentences:
+        sentence_index = SentenceIndex(chunks)
+        sentence_hashes, sentence_embeddings = embed_in_batches(
+            encoder, sentence_index.encode_texts,
+            previous.manifest.get('sentence_hashes') if previous and previous.sentence_embeddings is not None else None,
+            previous.sentence_embeddings if previous else None, batch_size, 'sentences', dim=embeddings.shape[1])
+
+    version = hashlib.sha256(''.join(hashes + sentence_hashes).encode('utf-8')).hexdigest()[:16]
+    if previous is not None and previous.version == version:
+        print(f"✅ Index {version} is already up to date")
+        return previous.manifest
+
+    manifest = write_corpus(index_dir, {
+        'version': version,
+        'model': encoder.cache_key,
+        'built_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'sources': sources,
+        'chunk_max_tokens': max_tokens,
+        'chunk_overlap': overlap,
+        'hashes': hashes,
+        'sentence_hashes': sentence_hashes,
+    }, chunks, embeddings, sentence_embeddings)
+    print(f"✅ Wrote index {version} to {index_dir} in {time.perf_counter() - start:.1f}s")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the multi-source retrieval index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Chunk, embed and publish every source")
+    build_parser.add_argument("--output", default=os.getenv("KB_INDEX_PATH") or DEFAULT_INDEX_DIR)
+    build_parser.add_argument("--knowledgebase", default=KB_PATH)
+    build_parser.add_argument("--no-knowledgebase", action="store_true")
+    build_parser.add_argument("--no-wordpress", action="store_true")
+    build_parser.add_argument("--wordpress-url", default=None, help="defaults to WP_BASE_URL")
+    build_parser.add_argument("--pdf-dir", default=None)
+    build_parser.add_argument("--batch-size", type=int, default=64)
+    build_parser.add_argument("--sentences", action="store_true",
+                              default=int(os.getenv("KB_COMPRESS_MAX_TOKENS", "0")) > 0,
+                              help="also embed sentence units for KB_COMPRESS_MAX_TOKENS")
+
+    info_parser = subparsers.add_parser("info", help="Describe the current index")
+    info_parser.add_argument("--output", default=os.getenv("KB_INDEX_PATH") or DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.output, None if args.no_knowledgebase else args.knowledgebase, not args.no_wordpress,
+              args.wordpress_url, args.pdf_dir, args.batch_size, args.sentences)
+    else:
+        corpus = load_corpus(args.output)
+        print(f"Index {corpus.version} ({corpus.model}): {corpus.describe()}")
+        print(f"Sentence vectors: {'yes' if corpus.sentence_embeddings is not None else 'no'}")
+
+if __name__ == "__main__":
+    main()
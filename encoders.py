@@ -0,0 +1,220 @@
+"""
+Selectable text encoder backends for knowledgebase retrieval
+
+Every encoder returns L2-normalized float32 vectors, so they can be scored
+against the section matrix with a plain inner product.
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+BACKENDS = ('torch', 'torch-int8', 'onnx')
+
+class QueryEncoder:
+    """Base class for encoders"""
+
+    backend = 'base'
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies the vector space this encoder produces, for the embedding cache"""
+        return self.model_name
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return f"{self.backend} ({self.model_name})"
+
+class TorchEncoder(QueryEncoder):
+    """SentenceTransformer on PyTorch, optionally with int8 dynamic quantization of the Linear layers"""
+
+    def __init__(self, model_name: str, quantize: bool = False):
+        super().__init__(model_name)
+        from sentence_transformers import SentenceTransformer
+
+        self.quantize = quantize
+        self.backend = 'torch-int8' if quantize else 'torch'
+        self.model = SentenceTransformer(model_name, device='cpu')
+        if quantize:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @property
+    def cache_key(self) -> str:
+        # Quantized weights shift the vectors slightly, so they get their own cache
+        return f"{self.model_name}#int8" if self.quantize else self.model_name
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32, copy=False)
+
+class OnnxEncoder(QueryEncoder):
+    """Transformer exported to ONNX and run on onnxruntime, with mean pooling.
+
+    Mean pooling matches the sentence-transformers all-* models
+    (all-mpnet-base-v2, all-MiniLM-L6-v2). The exported graph is cached under
+    export_dir so the export only happens once per model. Inputs are truncated
+    at the model's own max_seq_length unless max_length is given.
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, model_name: str, export_dir: str, max_length: Optional[int] = None):
+        super().__init__(model_name)
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError:
+            raise ImportError("The onnx encoder backend needs 'optimum[onnxruntime]' installed")
+
+        hub_name = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+        path = os.path.join(export_dir, model_name.replace('/', '__'))
+        if os.path.exists(os.path.join(path, 'model.onnx')):
+            self.model = ORTModelForFeatureExtraction.from_pretrained(path)
+            self.tokenizer = AutoTokenizer.from_pretrained(path)
+        else:
+            print(f"📤 Exporting {hub_name} to ONNX at {path}")
+            self.model = ORTModelForFeatureExtraction.from_pretrained(hub_name, export=True)
+            self.tokenizer = AutoTokenizer.from_pretrained(hub_name)
+            self.model.save_pretrained(path)
+            self.tokenizer.save_pretrained(path)
+            try:
+                from huggingface_hub import hf_hub_download
+                shutil.copy(hf_hub_download(hub_name, 'sentence_bert_config.json'), path)
+            except Exception as e:
+                print(f"⚠️ No sentence_bert_config.json for {hub_name}: {str(e)}")
+        self.max_length = max_length or self._max_seq_length(path)
+
+    def _max_seq_length(self, path: str) -> int:
+        """Truncation length SentenceTransformer uses for this model, else the tokenizer's limit"""
+        try:
+            with open(os.path.join(path, 'sentence_bert_config.json'), 'r', encoding='utf-8') as f:
+                return int(json.load(f)['max_seq_length'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return min(int(self.tokenizer.model_max_length), 512)
+
+    @property
+    def cache_key(self) -> str:
+        # onnxruntime kernels round differently from torch, so the vectors get their own cache
+        return f"{self.model_name}#onnx"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                   max_length=self.max_length, return_tensors='np')
+            hidden = self.model(**batch).last_hidden_state
+            hidden = np.asarray(hidden, dtype=np.float32)
+            mask = batch['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        if not outputs:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(outputs).astype(np.float32, copy=False)
+
+class BatchingEncoder(QueryEncoder):
+    """Coalesce concurrent single-query encode calls into one forward pass.
+
+    Callers enqueue their texts and block on a future. A dispatcher thread
+    takes the first waiting request, keeps collecting until max_batch texts
+    are queued or max_wait_ms has passed, encodes them as one batch and hands
+    each caller its own rows. Calls that are already a full batch (corpus
+    builds) go straight to the wrapped encoder.
+    """
+
+    def __init__(self, inner: QueryEncoder, max_batch: int = 32, max_wait_ms: float = 5.0):
+        super().__init__(inner.model_name)
+        self.inner = inner
+        self.backend = inner.backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._dispatcher_pid = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.batched_texts = 0
+
+    @property
+    def cache_key(self) -> str:
+        return self.inner.cache_key
+
+    def describe(self) -> str:
+        return f"{self.inner.describe()} batched (max {self.max_batch}, {self.max_wait * 1000:.0f}ms)"
+
+    def _ensure_dispatcher(self):
+        # Threads do not survive fork, so each worker starts its own dispatcher
+        if self._dispatcher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._dispatcher_pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._dispatch, args=(self._queue,),
+                                 name='kb-encoder-batcher', daemon=True).start()
+                self._dispatcher_pid = os.getpid()
+
+    def _dispatch(self, requests: queue.Queue):
+        while True:
+            batch = [requests.get()]
+            count = len(batch[0][0])
+            flush_at = time.perf_counter() + self.max_wait
+            while count < self.max_batch:
+                remaining = flush_at - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = self.inner.encode(texts, batch_size=max(len(texts), 1))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if len(texts) >= self.max_batch:
+            return self.inner.encode(texts, batch_size=batch_size)
+        self._ensure_dispatcher()
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'texts': self.batched_texts,
+            'mean_batch': round(self.batched_texts / self.batches, 2) if self.batches else 0.0
+        }
+
+def create_encoder(backend: str, model_name: str, cache_dir: str) -> QueryEncoder:
+    """Build the encoder selected by backend ('torch', 'torch-int8' or 'onnx')"""
+    if backend == 'torch':
+        return TorchEncoder(model_name)
+    if backend == 'torch-int8':
+        return TorchEncoder(model_name, quantize=True)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name, export_dir=os.path.join(cache_dir, 'onnx'))
+    raise ValueError(f"Unknown encoder backend: {backend} (expected one of {', '.join(BACKENDS)})")
@@ -370,10 +370,14 @@ window.palmsConfig = {
         }
     };
     
+    function palmsFormat(text) {
+        return text.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>');
+    }
+    
     function palmsAddMessage(text, isUser = false) {
         const msg = document.createElement('div');
         msg.className = 'palms-message ' + (isUser ? 'user' : 'bot');
-        msg.innerHTML = text.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>');
+        msg.innerHTML = palmsFormat(text);
         body.appendChild(msg);
         
         // Add clearfix
@@ -383,6 +387,7 @@ window.palmsConfig = {
         body.appendChild(clearfix);
         
         body.scrollTop = body.scrollHeight;
+        return msg;
     }
     
     function palmsAddTyping() {
@@ -399,6 +404,40 @@ window.palmsConfig = {
         if (typing) typing.remove();
     }
     
+    // Apply the flags of a finished answer (the `done` event or a /chat response)
+    function palmsFinishAnswer(data) {
+        if (data.show_options) {
+            optionsShownOnce = true;
+        }
+    }
+    
+    // Read a text/event-stream body, calling onEvent(name, data) for each event as it arrives
+    async function palmsReadEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let name = 'message';
+                const dataLines = [];
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) name = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) onEvent(name, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+    
     window.palmsSendMessage = async function(event) {
         event.preventDefault();
         
@@ -408,26 +447,66 @@ window.palmsConfig = {
         palmsAddMessage(message, true);
         input.value = '';
         
-        const typing = palmsAddTyping();
+        palmsAddTyping();
+        
+        const request = {
+            method: 'POST',
+            headers: { 
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({ 
+                message: message,
+                _wpnonce: window.palmsConfig.nonce
+            })
+        };
         
         try {
-            const response = await fetch(window.palmsConfig.apiUrl + '/chat', {
-                method: 'POST',
-                headers: { 
-                    'Content-Type': 'application/json',
-                    'X-Requested-With': 'XMLHttpRequest'
-                },
-                body: JSON.stringify({ 
-                    message: message,
-                    _wpnonce: window.palmsConfig.nonce
-                })
-            });
+            // Stream the answer so the first words show up as soon as the model writes them
+            const response = await fetch(window.palmsConfig.apiUrl + '/chat/stream', request);
             
-            const data = await response.json();
-            palmsRemoveTyping();
+            if (!response.ok || !response.body) {
+                // Older API or no streaming support in this browser: one-shot /chat
+                const fallback = await fetch(window.palmsConfig.apiUrl + '/chat', request);
+                const data = await fallback.json();
+                palmsRemoveTyping();
+                palmsAddMessage(data.response || "Sorry, I couldn't process your request.", false);
+                palmsFinishAnswer(data);
+                return;
+            }
+            
+            let botMsg = null;
+            let botText = '';
+            let finished = false;
             
-            const botText = data.response || "Sorry, I couldn't process your request.";
-            palmsAddMessage(botText, false);
+            await palmsReadEvents(response, (name, data) => {
+                if (name === 'token') {
+                    botText += data.text;
+                    if (!botMsg) {
+                        palmsRemoveTyping();
+                        botMsg = palmsAddMessage(botText, false);
+                    } else {
+                        botMsg.innerHTML = palmsFormat(botText);
+                        body.scrollTop = body.scrollHeight;
+                    }
+                } else if (name === 'done') {
+                    finished = true;
+                    // The final text is authoritative: it replaces partial text if the answer failed midway
+                    const finalText = data.response || "Sorry, I couldn't process your request.";
+                    palmsRemoveTyping();
+                    if (!botMsg) {
+                        botMsg = palmsAddMessage(finalText, false);
+                    } else {
+                        botMsg.innerHTML = palmsFormat(finalText);
+                    }
+                    body.scrollTop = body.scrollHeight;
+                    palmsFinishAnswer(data);
+                }
+            });
+            
+            if (!finished) {
+                throw new Error('Stream ended early');
+            }
             
         } catch (err) {
             palmsRemoveTyping();
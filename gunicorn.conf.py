@@ -0,0 +1,59 @@
+# gunicorn.conf.py - fork-shared worker setup for the chatbot API
+#
+# With preload_app the master imports app_simple once and forks the workers.
+# With KB_MASTER_PRELOAD as well it also loads the SentenceTransformer weights
+# and the memory-mapped embedding matrix (a cold cache is encoded by the first
+# worker instead). Those pages are inherited copy-on-write, so every worker
+# shares one copy of the model instead of loading its own.
+import gc
+import os
+import sys
+
+from memory_report import process_memory, format_memory
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+# More than one thread per worker switches to gthread workers, which lets
+# KB_ENCODER_MAX_BATCH coalesce concurrent queries into one forward pass
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+# Loading the model in the master shares it copy-on-write with every worker,
+# but no worker (and so no /health) answers until it has loaded. Off by
+# default: each worker then loads it in its background warmup instead
+master_preload = preload_app and os.environ.get('KB_MASTER_PRELOAD', 'false').lower() == 'true'
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, just before workers fork"""
+    if master_preload:
+        # Load the retriever here, synchronously, so workers inherit it. Only
+        # vectors already in the embedding cache are loaded: encoding misses,
+        # the warm-up probe query and any threads are left to the workers
+        # because torch inference does not survive fork safely
+        import chat
+        chat.warmup(probe=False)
+    if preload_app:
+        # Move every object allocated so far into the permanent generation so
+        # the cyclic GC in the workers never writes to (and un-shares) them
+        gc.collect()
+        gc.freeze()
+    server.log.info(f"📦 Master memory: {format_memory(process_memory())}")
+
+def post_fork(server, worker):
+    """Keep torch from oversubscribing the CPU with one thread pool per worker"""
+    threads = os.environ.get('KB_TORCH_THREADS')
+    # With the retrieval daemon the workers never load torch at all
+    if not threads or os.environ.get('KB_DAEMON_SOCKET'):
+        return
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(int(threads))
+    else:
+        # torch is imported later by the worker's warmup and reads this then;
+        # importing it here would slow every worker's boot
+        os.environ['OMP_NUM_THREADS'] = threads
+
+def post_worker_init(worker):
+    """Start the per-worker warmup and report memory so the shared/private split is visible"""
+    import chat
+    chat.start_warmup()
+    worker.log.info(f"👷 Worker memory: {format_memory(process_memory())}")
@@ -0,0 +1,71 @@
+"""
+Fast HTML-to-text cleaning for WordPress ingestion
+
+Follows the original BeautifulSoup cleaner (script, style and comments
+dropped, text nodes concatenated, whitespace collapsed) without building a
+parse tree: one regex pass removes the non-text blocks and tags, entities are
+decoded with html.unescape and whitespace is normalized with a single
+split/join. Well-formed markup, including quoted attribute values containing
+'>', gives the same text; malformed markup (unterminated quotes or comments)
+may not, and `kb_benchmark.py cleaning` reports how many items still match.
+"""
+import html
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+# Script/style bodies and comments go with their tags; any other tag is dropped on its own,
+# skipping over quoted attribute values so title="a>b" does not end the tag early (a tag
+# with an unterminated quote falls back to ending at the first '>').
+# A '<' not followed by a tag name (as in "a < b") is text, as in html.parser
+_MARKUP_RE = re.compile(r'<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->'
+                        r'|</?[a-zA-Z!?](?:[^>"\']|"[^"]*"|\'[^\']*\')*>|</?[a-zA-Z!?][^>]*>',
+                        re.IGNORECASE | re.DOTALL)
+
+# Below this many items the pool's startup cost outweighs the parallel speedup
+POOL_MIN_ITEMS = 500
+
+def clean_html(html_content: str) -> str:
+    """Visible text of an HTML fragment with runs of whitespace collapsed to one space"""
+    if not html_content:
+        return ""
+    text = html_content
+    if '<' in text:
+        text = _MARKUP_RE.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(text.split())
+
+def clean_item(content_type: str, item: Dict) -> Dict:
+    """Clean one REST API item into its cache key, searchable text and modified time"""
+    title = clean_html(item.get("title", {}).get("rendered", ""))
+    content = clean_html(item.get("content", {}).get("rendered", ""))
+    excerpt = clean_html(item.get("excerpt", {}).get("rendered", ""))
+
+    return {
+        "key": f"{content_type}_{item['id']}_{title[:30]}",
+        "text": f"{title}\n{excerpt}\n{content}".strip(),
+        "modified_gmt": item.get("modified_gmt", "")
+    }
+
+def _clean_batch(batch: List[Tuple[str, Dict]]) -> List[Dict]:
+    return [clean_item(content_type, item) for content_type, item in batch]
+
+def clean_items(items: List[Tuple[str, Dict]], workers: int = 0) -> List[Dict]:
+    """Clean (content_type, item) pairs, in a process pool for large batches.
+
+    workers=0 picks up to four processes from the CPU count; 1 always cleans
+    inline. The pool uses the spawn start method because refreshes run on a
+    background thread, and forking a threaded process is unsafe.
+    """
+    if workers <= 0:
+        workers = min(4, os.cpu_count() or 1)
+    if workers == 1 or len(items) < POOL_MIN_ITEMS:
+        return _clean_batch(items)
+
+    size = -(-len(items) // (workers * 4))
+    batches = [items[i:i + size] for i in range(0, len(items), size)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return [doc for cleaned in pool.map(_clean_batch, batches) for doc in cleaned]
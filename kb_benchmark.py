@@ -0,0 +1,523 @@
+"""
+Benchmarks for the knowledgebase retrieval path
+
+Usage:
+    python kb_benchmark.py quantization [--rows 100000] [--top-k 3]
+    python kb_benchmark.py index [--sizes 10000,100000] [--backends numpy,faiss-hnsw]
+    python kb_benchmark.py startup [--top 15]
+    python kb_benchmark.py encoders [--specs torch:all-mpnet-base-v2,onnx:all-mpnet-base-v2]
+    python kb_benchmark.py batching [--clients 1,8,32] [--max-batch 32] [--max-wait-ms 5]
+    python kb_benchmark.py context [--lambdas 1.0,0.7,0.5] [--compress 0,300,150] [--top-k 3]
+    python kb_benchmark.py wordpress [--workers 1,4,8] [--latency-ms 150]
+    python kb_benchmark.py keyword [--sizes 300,3000,30000]
+    python kb_benchmark.py cleaning [--dump wp_dump.json] [--source URL] [--workers 4]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledgebase.txt")
+
+# Typical widget phrasings, used wherever a benchmark needs real queries
+SAMPLE_QUERIES = [
+    "what is palms",
+    "inventory tracking",
+    "does palms support 3PL billing",
+    "barcode and RFID scanning",
+    "FEFO stock rotation",
+    "multi-warehouse management",
+    "mobile picking app",
+    "real-time dashboards and reporting",
+    "integration with ERP systems",
+    "how do I contact sales",
+    "cloud deployment options",
+    "client portal for 3PL customers",
+]
+
+def _latency_summary(timings: List[float]) -> Dict[str, float]:
+    """Mean and p95 in milliseconds"""
+    ms = np.array(timings) * 1000
+    return {"mean_ms": float(ms.mean()), "p95_ms": float(np.percentile(ms, 95))}
+
+def _synthetic_corpus(rows: int, dim: int, n_queries: int, seed: int = 0):
+    """Random normalized corpus plus queries that are noisy copies of corpus rows"""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    picks = rng.integers(0, rows, n_queries)
+    queries = matrix[picks] + 0.5 * rng.standard_normal((n_queries, dim)).astype(np.float32) / np.sqrt(dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return matrix, queries.astype(np.float32)
+
+def _kb_corpus():
+    """Cached knowledgebase matrix and encoded sample queries"""
+    from kb_retriever import KnowledgebaseRetriever
+    retriever = KnowledgebaseRetriever(KB_PATH)
+    queries = retriever.encoder.encode(SAMPLE_QUERIES)
+    return np.asarray(retriever.embeddings, dtype=np.float32), queries
+
+def bench_quantization(args):
+    """Recall@k and per-query latency of float16/int8 stores against the exact float32 scan"""
+    from vector_index import CompactEmbeddings, search_embeddings
+
+    if args.rows:
+        matrix, queries = _synthetic_corpus(args.rows, args.dim, args.queries)
+        print(f"🧪 Synthetic corpus: {args.rows} rows x {args.dim} dims, {len(queries)} queries")
+    else:
+        matrix, queries = _kb_corpus()
+        print(f"🧪 knowledgebase.txt: {matrix.shape[0]} sections, {len(queries)} queries")
+
+    exact_ids = None
+    print(f"{'store':<10}{'MB':>10}{'recall@' + str(args.top_k):>12}{'mean ms':>10}{'p95 ms':>10}")
+    for dtype in ("float32", "float16", "int8"):
+        compact = CompactEmbeddings(matrix, dtype) if dtype != "float32" else None
+        nbytes = compact.nbytes if compact is not None else matrix.nbytes
+
+        timings, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            ids, _ = search_embeddings(query[None, :], matrix, args.top_k, compact=compact,
+                                       rerank_factor=args.rerank_factor)
+            timings.append(time.perf_counter() - start)
+            found.append(ids[0])
+        found = np.array(found)
+
+        if exact_ids is None:
+            exact_ids = found
+        recall = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(found, exact_ids)])
+        latency = _latency_summary(timings)
+        print(f"{dtype:<10}{nbytes / (1024 * 1024):>10.2f}{recall:>12.3f}"
+              f"{latency['mean_ms']:>10.3f}{latency['p95_ms']:>10.3f}")
+
+def bench_index(args):
+    """Per-query latency and recall@k of each vector index backend as the corpus grows"""
+    from vector_index import create_index
+
+    print(f"{'rows':>8}  {'backend':<18}{'build s':>9}{'recall@' + str(args.top_k):>12}{'mean ms':>10}{'p95 ms':>10}")
+    for rows in [int(n) for n in args.sizes.split(",")]:
+        matrix, queries = _synthetic_corpus(rows, args.dim, args.queries)
+        exact_ids = None
+        for backend in args.backends.split(","):
+            start = time.perf_counter()
+            index = create_index(matrix, backend=backend)
+            build = time.perf_counter() - start
+
+            timings, found = [], []
+            for query in queries:
+                start = time.perf_counter()
+                ids, _ = index.search(query[None, :], args.top_k)
+                timings.append(time.perf_counter() - start)
+                found.append(ids[0])
+
+            if exact_ids is None:
+                exact_ids = found
+            recall = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(found, exact_ids)])
+            latency = _latency_summary(timings)
+            print(f"{rows:>8}  {index.describe():<18}{build:>9.2f}{recall:>12.3f}"
+                  f"{latency['mean_ms']:>10.3f}{latency['p95_ms']:>10.3f}")
+
+# Runs in a fresh interpreter so nothing is already imported or warm
+_STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import app_simple
+imported = time.perf_counter()
+import chat
+chat.start_warmup()
+chat.get_kb_retriever(timeout=600)
+ready = time.perf_counter()
+chat.generate_context_from_query("inventory tracking")
+first = time.perf_counter()
+chat.generate_context_from_query("3PL billing automation")
+second = time.perf_counter()
+print("STARTUP " + json.dumps({
+    "import_s": imported - start,
+    "ready_s": ready - start,
+    "first_retrieval_ms": (first - ready) * 1000,
+    "second_retrieval_ms": (second - first) * 1000,
+}))
+"""
+
+def bench_startup(args):
+    """Import time of the web app, time until /ready passes and first-request retrieval latency"""
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    # Cumulative import cost per top-level module from -X importtime
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app_simple"],
+                            cwd=here, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            imports.append((int(parts[1]), parts[2]))
+    print("📦 Slowest imports of app_simple (cumulative, nested modules included):")
+    for micros, module in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {micros / 1000:>9.1f} ms  {module}")
+
+    result = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=here, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("STARTUP ")]
+    if not lines:
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise SystemExit("Startup probe failed")
+    report = json.loads(lines[-1][len("STARTUP "):])
+    print(f"⏱️ import app_simple:        {report['import_s']:.2f} s")
+    print(f"⏱️ ready (model warm):       {report['ready_s']:.2f} s")
+    print(f"⏱️ first retrieval:          {report['first_retrieval_ms']:.1f} ms")
+    print(f"⏱️ second retrieval:         {report['second_retrieval_ms']:.1f} ms")
+
+def bench_encoders(args):
+    """Per-query latency and recall@k of encoder backends/models against the first spec"""
+    from chunker import chunk_markdown
+    from encoders import create_encoder
+    from kb_retriever import DEFAULT_CACHE_DIR
+
+    with open(KB_PATH, "r", encoding="utf-8") as f:
+        sections = [chunk["text"] for chunk in chunk_markdown(f.read())]
+
+    reference = None
+    print(f"{'encoder':<48}{'load s':>8}{'recall@' + str(args.top_k):>12}{'mean ms':>10}{'p95 ms':>10}")
+    for spec in args.specs.split(","):
+        backend, model_name = spec.split(":", 1)
+        start = time.perf_counter()
+        encoder = create_encoder(backend, model_name, DEFAULT_CACHE_DIR)
+        load = time.perf_counter() - start
+
+        matrix = encoder.encode(sections)
+        timings, found = [], []
+        for _ in range(args.repeat):
+            for query in SAMPLE_QUERIES:
+                start = time.perf_counter()
+                vector = encoder.encode([query])
+                timings.append(time.perf_counter() - start)
+                if len(found) < len(SAMPLE_QUERIES):
+                    found.append(np.argsort(-(matrix @ vector[0]))[:args.top_k])
+
+        if reference is None:
+            reference = found
+        recall = np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(found, reference)])
+        latency = _latency_summary(timings)
+        print(f"{encoder.describe():<48}{load:>8.2f}{recall:>12.3f}"
+              f"{latency['mean_ms']:>10.2f}{latency['p95_ms']:>10.2f}")
+
+def _run_clients(encoder, clients: int, per_client: int):
+    """Encode single queries from concurrent threads; returns (queries/s, per-call timings)"""
+    timings, lock = [], threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client(offset):
+        barrier.wait()
+        local = []
+        for i in range(per_client):
+            query = SAMPLE_QUERIES[(offset + i) % len(SAMPLE_QUERIES)]
+            start = time.perf_counter()
+            encoder.encode([query])
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return clients * per_client / elapsed, timings
+
+def bench_batching(args):
+    """Throughput of per-request encoding vs the micro-batching encoder at several client counts"""
+    from encoders import BatchingEncoder, create_encoder
+    from kb_retriever import DEFAULT_CACHE_DIR
+
+    plain = create_encoder(args.backend, args.model, DEFAULT_CACHE_DIR)
+    batched = BatchingEncoder(plain, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    plain.encode(["warmup"])
+
+    print(f"🧪 {plain.describe()}, {args.per_client} queries per client")
+    print(f"{'clients':>8}  {'encoder':<10}{'queries/s':>12}{'mean ms':>10}{'p95 ms':>10}{'mean batch':>12}")
+    for clients in [int(n) for n in args.clients.split(",")]:
+        for label, encoder in (("plain", plain), ("batched", batched)):
+            before = batched.stats()
+            throughput, timings = _run_clients(encoder, clients, args.per_client)
+            latency = _latency_summary(timings)
+            mean_batch = "1.00"
+            if encoder is batched:
+                after = batched.stats()
+                batches = after["batches"] - before["batches"]
+                mean_batch = f"{(after['texts'] - before['texts']) / batches:.2f}" if batches else "-"
+            print(f"{clients:>8}  {label:<10}{throughput:>12.1f}{latency['mean_ms']:>10.2f}"
+                  f"{latency['p95_ms']:>10.2f}{mean_batch:>12}")
+
+def bench_context(args):
+    """Prompt tokens, redundancy and query similarity of the retrieved context
+    with and without MMR selection and sentence compression"""
+    from chunker import count_tokens
+    from kb_retriever import KnowledgebaseRetriever
+
+    budgets = [int(x) for x in args.compress.split(",")]
+    if max(budgets) > 0 and int(os.getenv("KB_COMPRESS_MAX_TOKENS", "0")) <= 0:
+        # Sentence vectors are only built when compression is enabled
+        os.environ["KB_COMPRESS_MAX_TOKENS"] = str(max(budgets))
+    retriever = KnowledgebaseRetriever(KB_PATH)
+    embeddings = np.asarray(retriever.embeddings, dtype=np.float32)
+    index_of = {section: i for i, section in enumerate(retriever.sections)}
+    query_vectors = retriever.encoder.encode(SAMPLE_QUERIES)
+
+    print(f"🧪 {len(SAMPLE_QUERIES)} queries, top {args.top_k} of {retriever.mmr_candidates} candidates")
+    print(f"{'lambda':>8}{'compress':>10}{'mean tokens':>14}{'max tokens':>12}{'max pair cos':>14}"
+          f"{'query cos':>11}{'mean ms':>10}")
+    for mmr_lambda in [float(x) for x in args.lambdas.split(",")]:
+        for budget in budgets:
+            tokens, redundancy, contexts, timings = [], [], [], []
+            for query in SAMPLE_QUERIES:
+                start = time.perf_counter()
+                context = retriever.retrieve_relevant_context(query, top_k=args.top_k, max_tokens=args.max_tokens,
+                                                              mmr_lambda=mmr_lambda, compress_tokens=budget)
+                timings.append(time.perf_counter() - start)
+                contexts.append(context)
+                tokens.append(count_tokens(context))
+                ids = [index_of[part] for part in context.split("\n\n---\n\n") if part in index_of]
+                if len(ids) > 1:
+                    similarity = embeddings[ids] @ embeddings[ids].T
+                    redundancy.append(float(similarity[np.triu_indices(len(ids), 1)].max()))
+            # How well the context as a whole still matches the question
+            relevance = np.sum(retriever.encoder.encode(contexts) * query_vectors, axis=1)
+            print(f"{mmr_lambda:>8.2f}{budget or '-':>10}{np.mean(tokens):>14.1f}{max(tokens):>12}"
+                  f"{(f'{np.mean(redundancy):.3f}' if redundancy else '-'):>14}{relevance.mean():>11.3f}"
+                  f"{_latency_summary(timings)['mean_ms']:>10.2f}")
+
+def bench_wordpress(args):
+    """Full-site fetch time against the local stub WordPress at several parallelism levels,
+    the cost of full and incremental refreshes, and the payload size of a full fetch"""
+    from wp_fetcher import WordPressFetcher
+    from wp_stub_server import StubWordPress
+
+    with StubWordPress(pages=args.pages, posts=args.posts, latency_ms=args.latency_ms) as stub:
+        print(f"🧪 Stub WordPress: {args.pages} pages, {args.posts} posts, {args.latency_ms:.0f}ms per request, "
+              f"per_page={args.per_page}")
+        print(f"{'workers':>8}{'requests':>10}{'items':>8}{'seconds':>10}")
+        for workers in [int(n) for n in args.workers.split(",")]:
+            fetcher = WordPressFetcher(stub.url, max_workers=workers, per_page=args.per_page)
+            before = stub.requests
+            start = time.perf_counter()
+            collections = fetcher.fetch_all(["pages", "posts"])
+            elapsed = time.perf_counter() - start
+            fetcher.close()
+            items = sum(len(v) for v in collections.values())
+            print(f"{workers:>8}{stub.requests - before:>10}{items:>8}{elapsed:>10.2f}")
+
+        # Refresh cost: full sync, then incremental syncs on a quiet site and after one edit
+        from simple_retriever import SimpleRAG
+        # No content store: stub documents must never reach the app's shared store
+        rag = SimpleRAG(stub.url, store_path='')
+        print(f"\n{'sync':<22}{'requests':>10}{'bytes':>10}{'changed':>9}{'seconds':>10}")
+        for label, edit in (("full", False), ("incremental, quiet", False), ("incremental, 1 edit", True)):
+            if edit:
+                stub.touch("posts", 0)
+            requests_before, bytes_before = stub.requests, stub.bytes_sent
+            stats = rag.sync()
+            print(f"{label:<22}{stub.requests - requests_before:>10}{stub.bytes_sent - bytes_before:>10}"
+                  f"{stats['changed']:>9}{stats['seconds']:>10.2f}")
+
+        # Payload cost of one full fetch: every field, uncompressed, parsed from one buffered body
+        # vs the _fields projection, gzip transfer and incremental parsing
+        import tracemalloc
+        print(f"\n{'payload':<10}{'wire KB':>10}{'peak MB':>10}{'seconds':>10}")
+        for label, options in (("full", dict(fields=None, compress=False, stream=False)), ("slim", {})):
+            fetcher = WordPressFetcher(stub.url, max_workers=1, per_page=args.per_page, **options)
+            bytes_before = stub.bytes_sent
+            tracemalloc.start()
+            start = time.perf_counter()
+            fetcher.fetch_all(["pages", "posts"])
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            fetcher.close()
+            print(f"{label:<10}{(stub.bytes_sent - bytes_before) / 1024:>10.0f}{peak / 1e6:>10.1f}{elapsed:>10.2f}")
+
+def _scan_search(content: Dict[str, str], query: str, n_results: int) -> List[str]:
+    """The previous simple_search scorer: a substring count over every document per query"""
+    words = [w for w in query.lower().split() if len(w) > 2]
+    scored = []
+    for text in content.values():
+        text_lower = text.lower()
+        score = sum(text_lower.count(w) * len(w) for w in words)
+        score += sum(10 for w in words if w in text_lower[:100])
+        if score > 0:
+            scored.append((score, text))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [text for _, text in scored[:n_results]]
+
+def bench_keyword(args):
+    """Website keyword search latency: per-query corpus scan vs the BM25 inverted index"""
+    from simple_retriever import ContentIndex
+    from wp_stub_server import generate_items
+
+    print(f"{'docs':>8}  {'search':<8}{'build s':>9}{'mean ms':>10}{'p95 ms':>10}")
+    for size in [int(n) for n in args.sizes.split(",")]:
+        # Stub items cleaned with a regex: this measures search, not HTML parsing
+        content = {}
+        for item in generate_items("posts", size):
+            body = re.sub(r"<script.*?</script>|<style.*?</style>|<[^>]+>", " ", item["content"]["rendered"], flags=re.S)
+            content[f"posts_{item['id']}"] = f"{item['title']['rendered']}\n{' '.join(body.split())}"
+
+        start = time.perf_counter()
+        index = ContentIndex(content)
+        build = time.perf_counter() - start
+
+        for label, search in (("scan", lambda q: _scan_search(content, q, 5)), ("bm25", lambda q: index.search(q, 5))):
+            timings = []
+            for query in SAMPLE_QUERIES:
+                start = time.perf_counter()
+                search(query)
+                timings.append(time.perf_counter() - start)
+            latency = _latency_summary(timings)
+            print(f"{size:>8}  {label:<8}{(build if label == 'bm25' else 0.0):>9.2f}"
+                  f"{latency['mean_ms']:>10.2f}{latency['p95_ms']:>10.2f}")
+
+def _bs4_clean(html_content: str) -> str:
+    """The previous SimpleRAG.clean_html_content, kept here as the reference"""
+    if not html_content:
+        return ""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+def bench_cleaning(args):
+    """HTML cleaning time on a saved WordPress dump: BeautifulSoup vs the regex cleaner, inline and pooled"""
+    from html_cleaner import POOL_MIN_ITEMS, clean_item, clean_items
+
+    if not os.path.exists(args.dump):
+        # Save a dump once so later runs compare on identical input
+        from wp_fetcher import WordPressFetcher
+        from wp_stub_server import StubWordPress
+        stub = None
+        source = args.source
+        if not source:
+            stub = StubWordPress(pages=args.pages, posts=args.posts, latency_ms=0).start()
+            source = stub.url
+        collections = WordPressFetcher(source).fetch_all(["pages", "posts"])
+        if stub is not None:
+            stub.stop()
+        with open(args.dump, "w", encoding="utf-8") as f:
+            json.dump(collections, f)
+        print(f"💾 Saved {sum(len(v) for v in collections.values())} items from {args.source or 'the stub'} to {args.dump}")
+
+    with open(args.dump, "r", encoding="utf-8") as f:
+        collections = json.load(f)
+    items = [(content_type, item) for content_type, data in collections.items() for item in data]
+    html_bytes = sum(len(item.get("content", {}).get("rendered", "")) for _, item in items)
+    print(f"🧪 {len(items)} items, {html_bytes / 1e6:.1f} MB of content HTML, {os.cpu_count()} CPUs")
+
+    def bs4_item(content_type, item):
+        title = _bs4_clean(item.get("title", {}).get("rendered", ""))
+        content = _bs4_clean(item.get("content", {}).get("rendered", ""))
+        excerpt = _bs4_clean(item.get("excerpt", {}).get("rendered", ""))
+        return f"{title}\n{excerpt}\n{content}".strip()
+
+    start = time.perf_counter()
+    reference = [bs4_item(t, item) for t, item in items]
+    runs = [("beautifulsoup", time.perf_counter() - start, reference)]
+
+    start = time.perf_counter()
+    fast = [clean_item(t, item)["text"] for t, item in items]
+    runs.append(("regex", time.perf_counter() - start, fast))
+
+    if len(items) >= POOL_MIN_ITEMS:
+        start = time.perf_counter()
+        pooled = [doc["text"] for doc in clean_items(items, args.workers)]
+        runs.append((f"regex x{args.workers} procs", time.perf_counter() - start, pooled))
+
+    print(f"{'cleaner':<22}{'seconds':>9}{'items/s':>10}{'same text':>11}")
+    for label, seconds, texts in runs:
+        same = np.mean([a.split() == b.split() for a, b in zip(texts, reference)])
+        print(f"{label:<22}{seconds:>9.3f}{len(items) / seconds:>10.0f}{same:>11.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledgebase retrieval benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    quant = subparsers.add_parser("quantization", help="compact embedding store vs brute force")
+    quant.add_argument("--rows", type=int, default=0, help="use a synthetic corpus of this many rows")
+    quant.add_argument("--dim", type=int, default=768)
+    quant.add_argument("--queries", type=int, default=200)
+    quant.add_argument("--top-k", type=int, default=3)
+    quant.add_argument("--rerank-factor", type=int, default=4)
+    quant.set_defaults(func=bench_quantization)
+
+    index = subparsers.add_parser("index", help="vector index backends at growing corpus sizes")
+    index.add_argument("--sizes", default="10000,100000")
+    index.add_argument("--backends", default="numpy,faiss-flat,faiss-ivf,faiss-hnsw",
+                       help="comma-separated; the first one is the recall reference")
+    index.add_argument("--dim", type=int, default=768)
+    index.add_argument("--queries", type=int, default=200)
+    index.add_argument("--top-k", type=int, default=3)
+    index.set_defaults(func=bench_index)
+
+    startup = subparsers.add_parser("startup", help="import time, readiness and first-request latency")
+    startup.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    startup.set_defaults(func=bench_startup)
+
+    encoders = subparsers.add_parser("encoders", help="query encoder backends: latency and recall@k")
+    encoders.add_argument("--specs", default="torch:all-mpnet-base-v2,torch-int8:all-mpnet-base-v2,"
+                                             "onnx:all-mpnet-base-v2,torch:all-MiniLM-L6-v2",
+                          help="comma-separated backend:model pairs; the first is the recall reference")
+    encoders.add_argument("--top-k", type=int, default=3)
+    encoders.add_argument("--repeat", type=int, default=5)
+    encoders.set_defaults(func=bench_encoders)
+
+    batching = subparsers.add_parser("batching", help="micro-batching encoder throughput under concurrency")
+    batching.add_argument("--clients", default="1,8,32")
+    batching.add_argument("--per-client", type=int, default=20)
+    batching.add_argument("--backend", default="torch")
+    batching.add_argument("--model", default="all-mpnet-base-v2")
+    batching.add_argument("--max-batch", type=int, default=32)
+    batching.add_argument("--max-wait-ms", type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    context = subparsers.add_parser("context", help="prompt tokens of the retrieved context with MMR selection")
+    context.add_argument("--lambdas", default="1.0,0.7,0.5", help="comma-separated; 1.0 is plain top-k")
+    context.add_argument("--top-k", type=int, default=3)
+    context.add_argument("--max-tokens", type=int, default=None)
+    context.add_argument("--compress", default="0,300,150", help="comma-separated token budgets; 0 is no compression")
+    context.set_defaults(func=bench_context)
+
+    wordpress = subparsers.add_parser("wordpress", help="WordPress sync time against a local stub server")
+    wordpress.add_argument("--workers", default="1,4,8")
+    wordpress.add_argument("--pages", type=int, default=40)
+    wordpress.add_argument("--posts", type=int, default=250)
+    wordpress.add_argument("--per-page", type=int, default=50)
+    wordpress.add_argument("--latency-ms", type=float, default=150.0)
+    wordpress.set_defaults(func=bench_wordpress)
+
+    keyword = subparsers.add_parser("keyword", help="website keyword search: corpus scan vs BM25 index")
+    keyword.add_argument("--sizes", default="300,3000,30000")
+    keyword.set_defaults(func=bench_keyword)
+
+    cleaning = subparsers.add_parser("cleaning", help="HTML cleaning throughput on a saved WordPress dump")
+    cleaning.add_argument("--dump", default="wp_dump.json", help="created from --source (or the stub) if missing")
+    cleaning.add_argument("--source", default="", help="WordPress base URL to dump; empty uses the stub")
+    cleaning.add_argument("--pages", type=int, default=400)
+    cleaning.add_argument("--posts", type=int, default=2500)
+    cleaning.add_argument("--workers", type=int, default=4)
+    cleaning.set_defaults(func=bench_cleaning)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
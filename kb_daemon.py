@@ -0,0 +1,261 @@
+"""
+Standalone retrieval daemon serving encode/search over a Unix domain socket
+
+The daemon owns the embedding model and the index; web workers talk to it
+through RemoteRetriever, which has the same interface chat.py uses on
+KnowledgebaseRetriever but imports neither torch nor the model.
+
+Run it on the same host as the web processes:
+    KB_DAEMON_SOCKET=/tmp/palms-kb.sock python kb_daemon.py
+and start the web app with the same KB_DAEMON_SOCKET.
+
+Wire format (all integers big-endian). Every request and response is one
+frame: a 1-byte opcode (requests) or status (responses, 0 = ok) and a
+4-byte payload length, followed by the payload.
+
+    strings   u32 length + utf-8 bytes
+    ENCODE    req: u16 count + strings             resp: u32 rows, u32 dim, float32 rows*dim
+    SEARCH    req: u16 top_k, u16 count + strings  resp: per query u16 hits, each u32 id, f32 score, string
+    CONTEXT   req: u16 top_k, u32 max_tokens (0 = no limit), string
+              resp: string
+    PING, STATS, RELOAD                            resp: JSON (rare, not latency sensitive)
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_SOCKET = '/tmp/palms-kb.sock'
+
+OP_PING = 0
+OP_ENCODE = 1
+OP_SEARCH = 2
+OP_CONTEXT = 3
+OP_STATS = 4
+OP_RELOAD = 5
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_HEADER = struct.Struct('!BI')
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_HIT = struct.Struct('!If')
+
+class DaemonError(Exception):
+    """The daemon reported an error for a request"""
+
+def _pack_strings(texts: List[str]) -> bytes:
+    parts = [_U16.pack(len(texts))]
+    for text in texts:
+        data = text.encode('utf-8')
+        parts.append(_U32.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def _unpack_string(buffer: bytes, offset: int):
+    (length,) = _U32.unpack_from(buffer, offset)
+    offset += _U32.size
+    return buffer[offset:offset + length].decode('utf-8'), offset + length
+
+def _unpack_strings(buffer: bytes, offset: int):
+    (count,) = _U16.unpack_from(buffer, offset)
+    offset += _U16.size
+    texts = []
+    for _ in range(count):
+        text, offset = _unpack_string(buffer, offset)
+        texts.append(text)
+    return texts, offset
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _send_frame(sock: socket.socket, code: int, payload: bytes):
+    sock.sendall(_HEADER.pack(code, len(payload)) + payload)
+
+def _recv_frame(sock: socket.socket):
+    code, length = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return code, _recv_exact(sock, length) if length else b''
+
+# ---------------------------------------------------------------- server
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Serves frames on one persistent client connection until it closes"""
+
+    def handle(self):
+        retriever = self.server.retriever
+        while True:
+            try:
+                op, payload = _recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self._dispatch(retriever, op, payload)
+                _send_frame(self.request, STATUS_OK, response)
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                _send_frame(self.request, STATUS_ERROR, str(e).encode('utf-8'))
+
+    def _dispatch(self, retriever, op: int, payload: bytes) -> bytes:
+        if op == OP_ENCODE:
+            texts, _ = _unpack_strings(payload, 0)
+            vectors = np.ascontiguousarray(retriever.encoder.encode(texts), dtype=np.float32)
+            return _U32.pack(vectors.shape[0]) + _U32.pack(vectors.shape[1] if vectors.ndim == 2 else 0) + vectors.tobytes()
+
+        if op == OP_SEARCH:
+            (top_k,) = _U16.unpack_from(payload, 0)
+            queries, _ = _unpack_strings(payload, _U16.size)
+            parts = []
+            for hits in retriever.retrieve_many(queries, top_k):
+                parts.append(_U16.pack(len(hits)))
+                for hit in hits:
+                    section = hit['section'].encode('utf-8')
+                    parts.append(_HIT.pack(hit['id'], hit['score']) + _U32.pack(len(section)) + section)
+            return b''.join(parts)
+
+        if op == OP_CONTEXT:
+            (top_k,) = _U16.unpack_from(payload, 0)
+            (max_tokens,) = _U32.unpack_from(payload, _U16.size)
+            query, _ = _unpack_string(payload, _U16.size + _U32.size)
+            context = retriever.retrieve_relevant_context(query, top_k=top_k, max_tokens=max_tokens or None)
+            data = context.encode('utf-8')
+            return _U32.pack(len(data)) + data
+
+        if op == OP_PING:
+            return json.dumps({'pid': os.getpid(), 'version': retriever.index_version}).encode('utf-8')
+        if op == OP_STATS:
+            return json.dumps(retriever.stats()).encode('utf-8')
+        if op == OP_RELOAD:
+            return json.dumps(retriever.reload()).encode('utf-8')
+
+        raise ValueError(f"Unknown opcode: {op}")
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(socket_path: str = DEFAULT_SOCKET, knowledgebase_path: Optional[str] = None):
+    """Load the retriever once and serve it until interrupted"""
+    from kb_retriever import create_retriever
+
+    knowledgebase_path = knowledgebase_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledgebase.txt")
+    retriever = create_retriever(knowledgebase_path)
+    retriever.warm()
+    retriever.start_watching(float(os.getenv("KB_WATCH_INTERVAL", "5")))
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = _Server(socket_path, _Handler)
+    server.retriever = retriever
+    print(f"🛰️ Retrieval daemon listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+# ---------------------------------------------------------------- client
+
+class RemoteRetriever:
+    """Thin client for the retrieval daemon with a pool of persistent connections.
+
+    Mirrors the parts of KnowledgebaseRetriever that the web app uses.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, pool_size: int = 4, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._pool_pid = os.getpid()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _request(self, op: int, payload: bytes = b'') -> bytes:
+        # Connections inherited across fork would be shared with the parent
+        if self._pool_pid != os.getpid():
+            self._pool = queue.LifoQueue(maxsize=self._pool.maxsize)
+            self._pool_pid = os.getpid()
+
+        for attempt in range(2):
+            try:
+                sock = self._pool.get_nowait()
+            except queue.Empty:
+                sock = self._connect()
+            try:
+                _send_frame(sock, op, payload)
+                status, response = _recv_frame(sock)
+            except (ConnectionError, OSError):
+                sock.close()
+                # A pooled connection may have gone stale (daemon restart): retry once on a fresh one
+                if attempt == 0:
+                    continue
+                raise
+            try:
+                self._pool.put_nowait(sock)
+            except queue.Full:
+                sock.close()
+            if status != STATUS_OK:
+                raise DaemonError(response.decode('utf-8'))
+            return response
+
+    def warm(self):
+        """Readiness probe: succeeds once the daemon is up and answering"""
+        self.ping()
+
+    def ping(self) -> Dict:
+        return json.loads(self._request(OP_PING))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        response = self._request(OP_ENCODE, _pack_strings(texts))
+        (rows,) = _U32.unpack_from(response, 0)
+        (dim,) = _U32.unpack_from(response, _U32.size)
+        return np.frombuffer(response, dtype=np.float32, offset=2 * _U32.size).reshape(rows, dim)
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        response = self._request(OP_SEARCH, _U16.pack(top_k) + _pack_strings(queries))
+        results, offset = [], 0
+        for _ in queries:
+            (count,) = _U16.unpack_from(response, offset)
+            offset += _U16.size
+            hits = []
+            for _ in range(count):
+                hit_id, score = _HIT.unpack_from(response, offset)
+                section, offset = _unpack_string(response, offset + _HIT.size)
+                hits.append({'id': hit_id, 'score': score, 'section': section})
+            results.append(hits)
+        return results
+
+    def retrieve_relevant_context(self, query: str, top_k: int = 3, max_tokens: Optional[int] = None) -> str:
+        data = query.encode('utf-8')
+        payload = _U16.pack(top_k) + _U32.pack(max_tokens or 0) + _U32.pack(len(data)) + data
+        context, _ = _unpack_string(self._request(OP_CONTEXT, payload), 0)
+        return context
+
+    def stats(self) -> Dict:
+        return json.loads(self._request(OP_STATS))
+
+    def reload(self) -> Dict:
+        return json.loads(self._request(OP_RELOAD))
+
+    def start_watching(self, interval: float = 5.0):
+        """No-op: the daemon watches knowledgebase.txt itself"""
+
+if __name__ == "__main__":
+    serve(os.getenv("KB_DAEMON_SOCKET", DEFAULT_SOCKET))
@@ -1,55 +1,743 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers may encode twice
+    fcntl = None
+
+from bm25_index import BM25Index
+from chunker import chunk_markdown, count_tokens
+from context_compressor import CHUNK_SEPARATOR, SentenceIndex
+from corpus_index import MANIFEST_NAME, load_corpus
+from encoders import BatchingEncoder, create_encoder
+from vector_index import create_index
+
+DEFAULT_MODEL_NAME = 'all-mpnet-base-v2'
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.kb_cache')
+
+class EmbeddingCache:
+    """On-disk store of section embeddings keyed by section content hash and model name.
+
+    Vectors are stored L2-normalized in a plain .npy file so they can be
+    memory-mapped at startup and scored with a bare matrix multiply.
+    A small JSON manifest maps each row to the hash of the section it encodes
+    and names the .npy file, so swapping the manifest is the atomic commit point.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, name: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        # name keeps other text sets (e.g. sentence units) in their own manifest
+        slug = model_name.replace('/', '__') + (f".{name}" if name else '')
+        self.manifest_path = os.path.join(cache_dir, f"{slug}.json")
+
+    @staticmethod
+    def section_hash(model_name: str, text: str) -> str:
+        """Cache key for one section: content hash salted with the model name"""
+        return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def load(self):
+        """Return (hashes, memory-mapped matrix) or (None, None) if no usable cache exists"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # Older caches held unnormalized vectors; treat them as a miss
+            if manifest.get('model') != self.model_name or not manifest.get('normalized'):
+                return None, None
+            matrix = np.load(os.path.join(self.cache_dir, manifest['file']), mmap_mode='r')
+            hashes = manifest['hashes']
+            if matrix.ndim != 2 or matrix.shape[0] != len(hashes):
+                return None, None
+            return hashes, matrix
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def save(self, hashes: List[str], matrix: np.ndarray) -> np.ndarray:
+        """Persist the matrix and return it re-opened as a read-only memory map"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        digest = hashlib.sha256(''.join(hashes).encode('utf-8')).hexdigest()[:16]
+        slug = os.path.splitext(os.path.basename(self.manifest_path))[0]
+        filename = f"{slug}-{digest}.npy"
+        path = os.path.join(self.cache_dir, filename)
+
+        # Write under a per-process temp name first so concurrent workers never
+        # observe a partially written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+        tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'file': filename, 'normalized': True,
+                       'hashes': hashes}, f)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        self._remove_stale_files(keep=filename)
+        return np.load(path, mmap_mode='r')
+
+    def _remove_stale_files(self, keep: str):
+        """Delete matrices from older manifests (open memory maps stay valid on POSIX)"""
+        slug = os.path.splitext(os.path.basename(self.manifest_path))[0]
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f"{slug}-") and name.endswith('.npy') and name != keep:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+class QueryCache:
+    """Bounded LRU + TTL cache of query vectors and their top-k section ids.
+
+    Entries are keyed by normalized query text and tagged with the index
+    version they were computed against; a version change clears the cache.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.vector_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Collapse case, whitespace and trailing punctuation so near-identical phrasings share a key"""
+        return re.sub(r'\s+', ' ', query.lower()).strip().strip('?!.,;: ')
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry['created'] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set_version(self, version: str):
+        """Drop every entry if the index they were computed against has changed"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, key: str, top_k: int, version: Optional[str] = None):
+        """Return (vector, results) where either may be None on a miss"""
+        with self._lock:
+            entry = self._lookup(key) if version == self.version else None
+            if entry is None:
+                self.misses += 1
+                return None, None
+            results = entry['results'].get(top_k)
+            if results is not None:
+                self.hits += 1
+            else:
+                self.vector_hits += 1
+            return entry['vector'], results
+
+    def get_vector(self, key: str, version: Optional[str] = None) -> Optional[np.ndarray]:
+        """Return the cached query vector without touching the hit counters"""
+        with self._lock:
+            entry = self._lookup(key) if version == self.version else None
+            return entry['vector'] if entry is not None else None
+
+    def put(self, key: str, vector: np.ndarray, top_k: int, results: List, version: Optional[str] = None):
+        """Store the query vector and its top_k (id, score) pairs"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            # Results computed against an index that has since been swapped out
+            if version != self.version:
+                return
+            entry = self._lookup(key)
+            if entry is None:
+                entry = {'vector': vector, 'results': {}, 'created': time.monotonic()}
+                self._entries[key] = entry
+            entry['results'][top_k] = results
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.vector_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'vector_hits': self.vector_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+def mmr_select(hits: List[Dict], embeddings: np.ndarray, top_k: int, mmr_lambda: float,
+               max_similarity: float = 1.0) -> List[Dict]:
+    """Greedy maximal-marginal-relevance pick of up to top_k hits.
+
+    Each step takes the hit maximising
+        mmr_lambda * relevance - (1 - mmr_lambda) * max cosine to the hits already taken
+    where relevance is the first-stage score min-max scaled to [0, 1], so the
+    rule works the same for cosine, RRF and cross-encoder scores. Redundancy
+    uses the normalized section vectors already in the index. Hits whose
+    cosine to a taken hit exceeds max_similarity are dropped rather than
+    replaced, so near-duplicates shrink the context instead of padding it.
+    """
+    if len(hits) <= 1 or (mmr_lambda >= 1.0 and max_similarity >= 1.0):
+        return hits[:top_k]
+
+    vectors = np.asarray(embeddings[[hit['id'] for hit in hits]], dtype=np.float32)
+    similarity = vectors @ vectors.T
+    scores = np.array([hit['score'] for hit in hits], dtype=np.float32)
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    excluded = np.zeros(len(hits), dtype=bool)
+    excluded[selected[0]] = True
+    while len(selected) < top_k:
+        excluded |= redundancy > max_similarity
+        if excluded.all():
+            break
+        marginal = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        marginal[excluded] = -np.inf
+        best = int(np.argmax(marginal))
+        selected.append(best)
+        excluded[best] = True
+        redundancy = np.maximum(redundancy, similarity[best])
+    return [hits[i] for i in selected]
+
+class EmbeddingCacheMiss(Exception):
+    """Raised instead of encoding when a retriever built with encode_missing=False finds uncached texts"""
+
+class KBSnapshot:
+    """One immutable version of the index: chunks, their vectors and the search structures.
+
+    The retriever publishes a new snapshot with a single reference swap, and
+    every request reads the snapshot it started with, so an in-flight query
+    never sees a half-built index.
+    """
+
+    def __init__(self, chunks: List[Dict], embeddings: np.ndarray, version: str, index, bm25=None,
+                 sentences: Optional[SentenceIndex] = None):
+        self.chunks = chunks
+        self.sections = [chunk['text'] for chunk in chunks]
+        self.embeddings = embeddings
+        self.version = version
+        self.index = index
+        self.bm25 = bm25
+        self.sentences = sentences
+
+class _CacheLock:
+    """Exclusive flock on the cache directory so only one process encodes at a time"""
+
+    def __init__(self, cache_dir: str):
+        self.path = os.path.join(cache_dir, '.lock')
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.handle = open(self.path, 'w')
+                fcntl.flock(self.handle, fcntl.LOCK_EX)
+            except OSError:
+                self.handle = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
 
 class KnowledgebaseRetriever:
-    def __init__(self, knowledgebase_path: str):
-        # Initialize the sentence transformer model
-        self.model = SentenceTransformer('all-mpnet-base-v2')
+    def __init__(self, knowledgebase_path: str, model_name: Optional[str] = None,
+                 cache_dir: Optional[str] = None, encoder_backend: Optional[str] = None,
+                 index_path: Optional[str] = None, encode_missing: bool = True):
         self.knowledgebase_path = knowledgebase_path
-        self.sections = self._load_and_split_kb()
-        self.embeddings = self._create_embeddings()
+        # False in the gunicorn master: the first build only loads cached vectors
+        # and any encoding is left to the forked workers
+        self.encode_missing = encode_missing
+        # Prebuilt multi-source index from `python corpus_index.py build`; when set,
+        # the knowledgebase file is not read and no document is encoded here
+        self.index_path = index_path if index_path is not None else os.getenv('KB_INDEX_PATH', '')
+        self.cache_dir = cache_dir or os.getenv('KB_EMBEDDING_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+        # Initialize the encoder: PyTorch, int8-quantized PyTorch or ONNX, for
+        # mpnet or a smaller model such as all-MiniLM-L6-v2
+        self.model_name = model_name or os.getenv('KB_MODEL_NAME', DEFAULT_MODEL_NAME)
+        self.encoder = create_encoder(encoder_backend or os.getenv('KB_ENCODER_BACKEND', 'torch'),
+                                      self.model_name, self.cache_dir)
+        # Coalesce concurrent queries (threaded workers) into one forward pass
+        max_batch = int(os.getenv('KB_ENCODER_MAX_BATCH', '1'))
+        if max_batch > 1:
+            self.encoder = BatchingEncoder(self.encoder, max_batch=max_batch,
+                                           max_wait_ms=float(os.getenv('KB_ENCODER_MAX_WAIT_MS', '5')))
+        print(f"🧠 Encoder: {self.encoder.describe()}")
+
+        # Optional cross-encoder second stage over a wider candidate set
+        self.reranker = None
+        self.rerank_candidates = int(os.getenv('KB_RERANK_CANDIDATES', '10'))
+        self.rerank_budget = float(os.getenv('KB_RERANK_BUDGET_MS', '150')) / 1000.0
+        rerank_model = os.getenv('KB_RERANK_MODEL', '')
+        if rerank_model:
+            from reranker import CrossEncoderReranker
+            self.reranker = CrossEncoderReranker(rerank_model)
+            print(f"🎯 Re-ranker: {rerank_model}, {self.rerank_candidates} candidates, "
+                  f"{self.rerank_budget * 1000:.0f}ms budget")
 
-    def _load_and_split_kb(self) -> List[str]:
-        """Load and split the knowledgebase into sections"""
+        # Maximal-marginal-relevance selection of context chunks; 1.0 ranks by
+        # relevance alone (disabled), lower values trade relevance for diversity
+        self.mmr_lambda = float(os.getenv('KB_MMR_LAMBDA', '1.0'))
+        self.mmr_candidates = int(os.getenv('KB_MMR_CANDIDATES', '10'))
+        self.mmr_max_similarity = float(os.getenv('KB_MMR_MAX_SIMILARITY', '0.95'))
+
+        # Token budget for query-aware sentence extraction from the retrieved
+        # chunks (0 disables); sentence vectors are built with the index
+        self.compress_tokens = int(os.getenv('KB_COMPRESS_MAX_TOKENS', '0'))
+
+        # Cache of query vectors and results, invalidated whenever the index changes
+        self.query_cache = QueryCache(
+            max_size=int(os.getenv('KB_QUERY_CACHE_SIZE', '1024')),
+            ttl=float(os.getenv('KB_QUERY_CACHE_TTL', '3600'))
+        )
+
+        self._reload_lock = threading.Lock()
+        self._kb_mtime = self._current_mtime()
+        self._watcher_pid = None
+        self._snapshot = None
+        try:
+            self._publish(self._build_snapshot())
+        except EmbeddingCacheMiss as e:
+            # The first worker to call ensure_built() encodes the misses under
+            # _CacheLock and the others then load its cache
+            print(f"⏳ {str(e)}; deferring the index build to the workers")
+        finally:
+            # Only the constructor's build is cache-only; later builds (ensure_built,
+            # reload) run in the workers and always encode what changed
+            self.encode_missing = True
+
+    # Read-only views of the current snapshot, kept for existing callers
+    @property
+    def sections(self) -> List[str]:
+        return self._snapshot.sections
+
+    @property
+    def chunks(self) -> List[Dict]:
+        return self._snapshot.chunks
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._snapshot.embeddings
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @property
+    def index_version(self) -> str:
+        return self._snapshot.version
+
+    def ensure_built(self):
+        """Build the index if construction deferred it because the embedding cache was incomplete"""
+        if self._snapshot is not None:
+            return
+        with self._reload_lock:
+            if self._snapshot is None:
+                mtime = self._current_mtime()
+                self._publish(self._build_snapshot())
+                self._kb_mtime = mtime
+
+    def _load_and_split_kb(self) -> List[Dict]:
+        """Load the knowledgebase and split it into token-bounded chunks"""
         with open(self.knowledgebase_path, 'r', encoding='utf-8') as f:
             content = f.read()
-        
-        # Split by main sections (##) and subsections (###)
-        sections = []
-        current_section = []
-        
-        for line in content.split('\n'):
-            if line.startswith('##') or line.startswith('###'):
-                if current_section:
-                    sections.append('\n'.join(current_section))
-                current_section = [line]
+
+        # Chunks never cross a heading; oversized sections are windowed with
+        # overlap and bare headings are folded into the section that follows
+        return chunk_markdown(
+            content,
+            max_tokens=int(os.getenv('KB_CHUNK_MAX_TOKENS', '256')),
+            overlap=int(os.getenv('KB_CHUNK_OVERLAP', '32'))
+        )
+
+    def _create_embeddings(self, sections: List[str], name: Optional[str] = None):
+        """Create embeddings for all sections, reusing vectors from the on-disk cache.
+
+        name selects a separate cache manifest for texts that are not
+        sections. Returns (matrix, version) where version identifies this
+        exact list of texts.
+        """
+        cache = EmbeddingCache(self.cache_dir, self.encoder.cache_key, name)
+        label = name or 'section'
+        hashes = [EmbeddingCache.section_hash(self.encoder.cache_key, s) for s in sections]
+        version = hashlib.sha256(''.join(hashes).encode('utf-8')).hexdigest()[:16]
+
+        with _CacheLock(self.cache_dir):
+            cached_hashes, cached_matrix = cache.load()
+
+            # Unchanged knowledgebase: serve the memory map directly, no encoding at all
+            if cached_hashes == hashes:
+                print(f"📦 Loaded {len(hashes)} cached {label} embeddings")
+                return cached_matrix, version
+
+            cached_rows: Dict[str, int] = {h: i for i, h in enumerate(cached_hashes or [])}
+            missing = [i for i, h in enumerate(hashes) if h not in cached_rows]
+
+            if missing and not self.encode_missing:
+                raise EmbeddingCacheMiss(f"{len(missing)} {label} embeddings are not cached")
+
+            new_vectors = None
+            if missing:
+                new_vectors = self.encoder.encode([sections[i] for i in missing])
+            dim = new_vectors.shape[1] if new_vectors is not None else cached_matrix.shape[1]
+
+            matrix = np.empty((len(hashes), dim), dtype=np.float32)
+            for i, h in enumerate(hashes):
+                if h in cached_rows:
+                    matrix[i] = cached_matrix[cached_rows[h]]
+            if missing:
+                matrix[missing] = new_vectors
+
+            print(f"🧮 Encoded {len(missing)} new/changed {label} texts, reused {len(hashes) - len(missing)}")
+            try:
+                return cache.save(hashes, matrix), version
+            except OSError as e:
+                print(f"⚠️ Could not write embedding cache: {str(e)}")
+                # Keep the in-memory fallback read-only too so forked workers share it
+                matrix.flags.writeable = False
+                return matrix, version
+
+    def _create_index(self, embeddings: np.ndarray, version: str):
+        """Create the vector index selected by KB_INDEX_BACKEND"""
+        index = create_index(
+            embeddings,
+            backend=os.getenv('KB_INDEX_BACKEND', 'numpy'),
+            cache_dir=self.cache_dir,
+            version=version,
+            # float16/int8 first-pass store for the numpy backend; the float32
+            # matrix stays memory-mapped and is only read for re-rank candidates
+            store=os.getenv('KB_EMBEDDING_STORE', 'float32'),
+            rerank_factor=int(os.getenv('KB_RERANK_FACTOR', '4'))
+        )
+        print(f"🔎 Vector index: {index.describe()} over {len(embeddings)} sections")
+        return index
+
+    def _build_snapshot(self) -> KBSnapshot:
+        """Build a complete new index from the knowledgebase file without touching the live one"""
+        if self.index_path:
+            return self._load_prebuilt()
+        chunks = self._load_and_split_kb()
+        embeddings, version = self._create_embeddings([chunk['text'] for chunk in chunks])
+        snapshot = KBSnapshot(chunks, embeddings, version, self._create_index(embeddings, version))
+        if self.compress_tokens > 0:
+            snapshot.sentences = SentenceIndex(chunks)
+            snapshot.sentences.embeddings, _ = self._create_embeddings(snapshot.sentences.encode_texts, 'sentence')
+        return snapshot
+
+    def _load_prebuilt(self) -> KBSnapshot:
+        """Snapshot over the memory-mapped artifact at index_path, read-only"""
+        corpus = load_corpus(self.index_path)
+        if corpus.model != self.encoder.cache_key:
+            # Query vectors from another model would be scored in the wrong space
+            raise ValueError(f"Index at {self.index_path} was built with {corpus.model}, "
+                             f"but the encoder is {self.encoder.cache_key}")
+        print(f"📦 Loaded prebuilt index {corpus.version}: {corpus.describe()}")
+        snapshot = KBSnapshot(corpus.chunks, corpus.embeddings, corpus.version,
+                              self._create_index(corpus.embeddings, corpus.version))
+        if self.compress_tokens > 0:
+            sentences = SentenceIndex(corpus.chunks)
+            if corpus.sentence_embeddings is None or len(corpus.sentence_embeddings) != len(sentences.encode_texts):
+                print("⚠️ Prebuilt index has no matching sentence vectors (build with --sentences); "
+                      "context compression is off")
             else:
-                current_section.append(line)
-        
-        if current_section:
-            sections.append('\n'.join(current_section))
-        
-        return sections
+                sentences.embeddings = corpus.sentence_embeddings
+                snapshot.sentences = sentences
+        return snapshot
 
-    def _create_embeddings(self) -> np.ndarray:
-        """Create embeddings for all sections"""
-        return self.model.encode(self.sections)
+    def _publish(self, snapshot: KBSnapshot):
+        """Make snapshot the live index with a single reference swap"""
+        self._snapshot = snapshot
+        self.query_cache.set_version(snapshot.version)
 
-    def retrieve_relevant_context(self, query: str, top_k: int = 3) -> str:
-        """Retrieve the most relevant sections for a given query"""
-        # Create query embedding
-        query_embedding = self.model.encode([query])[0]
-        
-        # Calculate similarities
-        similarities = np.dot(self.embeddings, query_embedding)
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+    def _current_mtime(self) -> float:
+        # A prebuilt index is republished by swapping its manifest
+        path = os.path.join(self.index_path, MANIFEST_NAME) if self.index_path else self.knowledgebase_path
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    def reload(self) -> Dict:
+        """Rebuild the index from the knowledgebase file and swap it in atomically.
+
+        Only chunks whose content hash changed are re-encoded; with a prebuilt
+        index the newly published artifact is loaded instead. Requests already
+        running keep using the snapshot they started with.
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            # Read before building so an edit made during the build triggers
+            # another reload, but record it only once the build succeeded so a
+            # failed build is retried on the next check
+            mtime = self._current_mtime()
+            old = self._snapshot
+            new = self._build_snapshot()
+            changed = new.version != old.version
+            if changed:
+                self._publish(new)
+            self._kb_mtime = mtime
+
+            old_texts, new_texts = set(old.sections), set(new.sections)
+            summary = {
+                'changed': changed,
+                'version': self._snapshot.version,
+                'sections': len(new.sections),
+                'added': len(new_texts - old_texts),
+                'removed': len(old_texts - new_texts),
+                'seconds': round(time.perf_counter() - start, 3)
+            }
+            print(f"♻️ Knowledgebase reload: {summary}")
+            return summary
+
+    def reload_if_changed(self) -> Optional[Dict]:
+        """Reload only if the knowledgebase file's mtime moved since the last build"""
+        if self._current_mtime() == self._kb_mtime:
+            return None
+        return self.reload()
+
+    def start_watching(self, interval: float = 5.0):
+        """Poll the knowledgebase file (or prebuilt index manifest) in a daemon thread and hot-reload on change.
+
+        Safe to call more than once; threads do not survive fork, so each
+        gunicorn worker calls this after it is forked.
+        """
+        if interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    print(f"❌ Knowledgebase reload failed: {str(e)}")
+
+        threading.Thread(target=watch, name='kb-watcher', daemon=True).start()
+
+    def warm(self):
+        """Run one throwaway encode so lazy initialisation is not paid by the first request"""
+        self.ensure_built()
+        self.encoder.encode(['warmup'])
+        if self.reranker is not None:
+            self.reranker.warm(self.rerank_candidates)
+
+    def stats(self) -> Dict:
+        """Counters for the /health endpoint"""
+        data = {'index_version': self.index_version, 'retrieval_cache': self.query_cache.stats()}
+        if isinstance(self.encoder, BatchingEncoder):
+            data['encoder_batching'] = self.encoder.stats()
+        if self.reranker is not None:
+            data['reranker'] = self.reranker.stats()
+        return data
+
+    def retrieve_many(self, queries: List[str], top_k: int = 3) -> List[List[Dict]]:
+        """Retrieve the top_k sections for each query in a single batched pass.
+
+        Returns one list per query of {'id', 'score', 'section'} dicts ordered by
+        descending cosine similarity.
+        """
+        return self._search(self._snapshot, queries, top_k)
+
+    def _search(self, snapshot: KBSnapshot, queries: List[str], top_k: int) -> List[List[Dict]]:
+        """First-stage retrieval, followed by cross-encoder re-ranking when enabled"""
+        if self.reranker is None:
+            return self._retrieve(snapshot, queries, top_k)
+
+        # The budget covers the whole request, first stage included
+        deadline = time.perf_counter() + self.rerank_budget
+        candidates = self._retrieve(snapshot, queries, max(top_k, self.rerank_candidates))
+        return [self.reranker.rerank(query, hits, top_k, deadline) for query, hits in zip(queries, candidates)]
+
+    def _retrieve(self, snapshot: KBSnapshot, queries: List[str], top_k: int) -> List[List[Dict]]:
+        if not queries:
+            return []
+
+        keys = [QueryCache.normalize(q) for q in queries]
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        vectors: List[Optional[np.ndarray]] = [None] * len(queries)
+
+        for i, key in enumerate(keys):
+            vector, cached = self.query_cache.get(key, top_k, snapshot.version)
+            vectors[i] = vector
+            if cached is not None:
+                results[i] = [{'id': idx, 'score': score, 'section': snapshot.sections[idx]} for idx, score in cached]
+
+        # One forward pass for every query whose vector is not cached,
+        # normalized like the section vectors
+        to_encode = [i for i, v in enumerate(vectors) if v is None]
+        if to_encode:
+            encoded = self.encoder.encode([queries[i] for i in to_encode])
+            for i, vector in zip(to_encode, encoded):
+                vectors[i] = vector
+
+        to_score = [i for i, r in enumerate(results) if r is None]
+        if to_score:
+            scored = self._top_k(snapshot, np.stack([vectors[i] for i in to_score]), top_k)
+            for i, hits in zip(to_score, scored):
+                results[i] = hits
+                self.query_cache.put(keys[i], vectors[i], top_k, [(h['id'], h['score']) for h in hits],
+                                     snapshot.version)
+
+        return results
+
+    def _top_k(self, snapshot: KBSnapshot, query_embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """Score normalized query vectors against all sections and pick the best top_k"""
+        ids, scores = snapshot.index.search(query_embeddings, top_k)
+        return [
+            [{'id': int(i), 'score': float(score), 'section': snapshot.sections[i]} for i, score in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
+
+    def _query_vector(self, snapshot: KBSnapshot, query: str) -> np.ndarray:
+        """Normalized query vector, from the query cache when the search just stored it"""
+        vector = self.query_cache.get_vector(QueryCache.normalize(query), snapshot.version)
+        if vector is None:
+            vector = self.encoder.encode([query])[0]
+        return vector
+
+    def retrieve_relevant_context(self, query: str, top_k: int = 3, max_tokens: Optional[int] = None,
+                                  mmr_lambda: Optional[float] = None, compress_tokens: Optional[int] = None) -> str:
+        """Retrieve the most relevant sections for a given query.
+
+        With mmr_lambda below 1.0 (default KB_MMR_LAMBDA) the top_k are picked
+        by maximal marginal relevance from a wider candidate set, and chunks
+        above KB_MMR_MAX_SIMILARITY to one already taken are dropped. With
+        max_tokens set, chunks are taken in rank order and any chunk that
+        would push the joined context (separators included) over the budget
+        is skipped.
+
+        With compress_tokens set (default KB_COMPRESS_MAX_TOKENS), only the
+        sentences of the retrieved chunks most similar to the query are kept,
+        up to that many tokens (or max_tokens if lower).
+        """
+        snapshot = self._snapshot
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        if mmr_lambda < 1.0:
+            candidates = self._search(snapshot, [query], max(top_k, self.mmr_candidates))[0]
+            results = mmr_select(candidates, snapshot.embeddings, top_k, mmr_lambda, self.mmr_max_similarity)
+        else:
+            results = self._search(snapshot, [query], top_k)[0]
+
+        compress_tokens = self.compress_tokens if compress_tokens is None else compress_tokens
+        if compress_tokens > 0 and snapshot.sentences is not None:
+            budget = min(compress_tokens, max_tokens) if max_tokens is not None else compress_tokens
+            compressed = snapshot.sentences.compress(self._query_vector(snapshot, query),
+                                                     [r['id'] for r in results], budget)
+            return CHUNK_SEPARATOR.join(compressed)
         
         # Get relevant sections
-        relevant_sections = [self.sections[i] for i in top_indices]
+        relevant_sections = []
+        used_tokens = 0
+        separator_tokens = count_tokens(CHUNK_SEPARATOR)
+        for r in results:
+            tokens = snapshot.chunks[r['id']]['tokens']
+            # Every chunk after the first also brings the separator it is joined with
+            if relevant_sections:
+                tokens += separator_tokens
+            if max_tokens is not None and used_tokens + tokens > max_tokens:
+                continue
+            relevant_sections.append(r['section'])
+            used_tokens += tokens
         
         # Join sections with clear separators
-        context = "\n\n---\n\n".join(relevant_sections)
+        context = CHUNK_SEPARATOR.join(relevant_sections)
         
         return context
+
+class HybridRetriever(KnowledgebaseRetriever):
+    """Dense retrieval fused with a BM25 keyword index by reciprocal-rank fusion.
+
+    BM25 catches exact product terms (3PL, FEFO, RFID) that the dense model
+    sometimes ranks low. Both stages produce a candidate list and each section
+    scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    """
+
+    def __init__(self, knowledgebase_path: str, rrf_k: int = 60, candidates: int = 20, **kwargs):
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self._executor = None
+        self._executor_pid = None
+        super().__init__(knowledgebase_path, **kwargs)
+
+    @property
+    def bm25(self) -> BM25Index:
+        return self._snapshot.bm25
+
+    def _build_snapshot(self) -> KBSnapshot:
+        """Dense snapshot plus a BM25 index over the same chunks"""
+        snapshot = super()._build_snapshot()
+        snapshot.bm25 = BM25Index(snapshot.sections)
+        return snapshot
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Threads do not survive fork, so each gunicorn worker gets its own pool,
+        # one thread per request thread so no request queues behind another
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=max(1, int(os.getenv('GUNICORN_THREADS', '1'))),
+                                                thread_name_prefix='kb-bm25')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _retrieve(self, snapshot: KBSnapshot, queries: List[str], top_k: int) -> List[List[Dict]]:
+        """Fused top_k per query; 'score' is the RRF score, not a cosine similarity"""
+        if not queries:
+            return []
+
+        # BM25 postings are scored in the pool while dense search runs on the
+        # calling thread, so concurrent requests still reach the BatchingEncoder
+        # together and share one forward pass
+        sparse_future = self._get_executor().submit(
+            lambda: [snapshot.bm25.search(q, self.candidates) for q in queries])
+        dense = super()._retrieve(snapshot, queries, self.candidates)
+        sparse = sparse_future.result()
+
+        results = []
+        for dense_hits, sparse_hits in zip(dense, sparse):
+            fused: Dict[int, float] = {}
+            for rank, hit in enumerate(dense_hits):
+                fused[hit['id']] = fused.get(hit['id'], 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            for rank, (doc_id, _) in enumerate(sparse_hits):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+            best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            results.append([{'id': i, 'score': score, 'section': snapshot.sections[i]} for i, score in best])
+        return results
+
+def create_retriever(knowledgebase_path: str, **kwargs) -> KnowledgebaseRetriever:
+    """Build the retriever selected by KB_RETRIEVER ('dense' or 'hybrid')"""
+    # KB_RETRIEVER=hybrid fuses dense retrieval with BM25 keyword matching
+    if os.getenv("KB_RETRIEVER", "dense").lower() == "hybrid":
+        return HybridRetriever(knowledgebase_path, **kwargs)
+    return KnowledgebaseRetriever(knowledgebase_path, **kwargs)
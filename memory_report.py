@@ -0,0 +1,42 @@
+"""
+Per-process memory figures for the chatbot workers
+"""
+import os
+import resource
+from typing import Dict
+
+def process_memory() -> Dict[str, float]:
+    """Return this process's memory usage in MB.
+
+    On Linux the figures come from /proc/self/smaps_rollup, which splits RSS
+    into pages shared with other processes (e.g. the preloaded model inherited
+    from the gunicorn master) and pages private to this worker. PSS charges
+    each shared page fractionally, so summing PSS across workers gives the
+    real footprint of the whole server.
+    """
+    fields = {'Rss': 'rss_mb', 'Pss': 'pss_mb',
+              'Shared_Clean': 'shared_mb', 'Shared_Dirty': 'shared_mb',
+              'Private_Clean': 'private_mb', 'Private_Dirty': 'private_mb'}
+    usage = {'pid': os.getpid()}
+
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in fields:
+                    key = fields[name]
+                    usage[key] = usage.get(key, 0.0) + int(rest.split()[0]) / 1024.0
+    except OSError:
+        # Non-Linux fallback: peak RSS only (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['rss_mb'] = peak / (1024.0 * 1024.0) if os.uname().sysname == 'Darwin' else peak / 1024.0
+
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in usage.items()}
+
+def format_memory(usage: Dict[str, float]) -> str:
+    """One-line summary suitable for logs"""
+    parts = [f"pid={usage['pid']}", f"rss={usage.get('rss_mb', 0)}MB"]
+    for key in ('pss_mb', 'shared_mb', 'private_mb'):
+        if key in usage:
+            parts.append(f"{key[:-3]}={usage[key]}MB")
+    return ' '.join(parts)
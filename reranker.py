@@ -0,0 +1,113 @@
+"""
+Cross-encoder re-ranking of retrieved knowledgebase chunks under a latency budget
+"""
+import threading
+import time
+from typing import Dict, List, Tuple
+
+class CrossEncoderReranker:
+    """Re-score (query, chunk) pairs with a small cross-encoder and keep the best k.
+
+    The stage is bounded by a deadline. It is skipped up front when the
+    expected cost (a moving average of the per-pair time) does not fit in the
+    time left, and abandoned between batches once the deadline passes. In both
+    cases the first-stage order is returned unchanged. After probe_every
+    skips in a row the stage runs anyway, so one slow outlier cannot keep it
+    disabled; the deadline still bounds that probe.
+    """
+
+    def __init__(self, model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2', batch_size: int = 8,
+                 probe_every: int = 20):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device='cpu')
+        self.batch_size = batch_size
+        self.probe_every = probe_every
+        self.pair_seconds = None
+        self._skips_in_row = 0
+        self._lock = threading.Lock()
+        self.ran = 0
+        self.skipped = 0
+        self.aborted = 0
+
+    def _record_timing(self, seconds: float, pairs: int, replace: bool = False):
+        per_pair = seconds / max(pairs, 1)
+        with self._lock:
+            # Exponential moving average so one slow call does not disable the stage;
+            # a probe replaces the estimate that had been skipping the stage outright
+            if self.pair_seconds is None or replace:
+                self.pair_seconds = per_pair
+            else:
+                self.pair_seconds = 0.8 * self.pair_seconds + 0.2 * per_pair
+
+    def _count(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        scores = []
+        for offset in range(0, len(pairs), self.batch_size):
+            scores.extend(self.model.predict(pairs[offset:offset + self.batch_size]))
+        return scores
+
+    def warm(self, pairs: int = 10):
+        """Seed the timing from a warm request-sized batch so model initialisation is not charged to it.
+
+        The first pass absorbs first-inference overhead and is not timed; the
+        second is scored like a real request of `pairs` candidates.
+        """
+        batch = [('warmup query', 'warmup passage')] * max(pairs, 1)
+        self._predict(batch)
+        start = time.perf_counter()
+        self._predict(batch)
+        self._record_timing(time.perf_counter() - start, len(batch))
+
+    def rerank(self, query: str, hits: List[Dict], top_k: int, deadline: float) -> List[Dict]:
+        """Return the top_k of hits by cross-encoder score, or hits[:top_k] if the budget does not allow it.
+
+        deadline is a time.perf_counter() value.
+        """
+        if len(hits) <= 1:
+            return hits[:top_k]
+
+        probe = False
+        remaining = deadline - time.perf_counter()
+        if self.pair_seconds is not None and self.pair_seconds * len(hits) > remaining:
+            with self._lock:
+                self._skips_in_row += 1
+                probe = self._skips_in_row >= self.probe_every
+                if probe:
+                    self._skips_in_row = 0
+            if not probe:
+                self._count('skipped')
+                return hits[:top_k]
+
+        scores = []
+        start = time.perf_counter()
+        for offset in range(0, len(hits), self.batch_size):
+            if time.perf_counter() > deadline:
+                # Partial timings still refresh the estimate a probe was run for
+                if scores:
+                    self._record_timing(time.perf_counter() - start, len(scores), replace=probe)
+                self._count('aborted')
+                return hits[:top_k]
+            batch = hits[offset:offset + self.batch_size]
+            scores.extend(self.model.predict([(query, hit['section']) for hit in batch]))
+        self._record_timing(time.perf_counter() - start, len(hits), replace=probe)
+        with self._lock:
+            self._skips_in_row = 0
+        self._count('ran')
+
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)[:top_k]
+        return [{**hits[i], 'score': float(scores[i]), 'first_stage_score': hits[i]['score']} for i in order]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'ran': self.ran,
+                'skipped': self.skipped,
+                'aborted': self.aborted,
+                'pair_ms': round(self.pair_seconds * 1000, 2) if self.pair_seconds is not None else None
+            }
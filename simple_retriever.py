@@ -1,126 +1,335 @@
-import requests
+import heapq
 import json
-from typing import List, Dict
-from bs4 import BeautifulSoup
+import os
+from typing import List, Dict, Optional
 import re
+import threading
 import time
+from datetime import datetime, timedelta
+
+from bm25_index import BM25Index
+from content_store import DEFAULT_CONTENT_DB, ContentStore
+from html_cleaner import clean_html, clean_items
+from wp_fetcher import DEFAULT_BASE_URL, WordPressFetcher
+
+class ContentIndex:
+    """BM25 over the cleaned website documents with a separate title field.
+
+    Built once per content refresh. A query scores only the postings of its
+    own terms in the body and title indexes; title matches are weighted by
+    title_weight, which replaces the old flat boost for words in the first
+    100 characters.
+    """
+
+    def __init__(self, content: Dict[str, str], title_weight: float = 2.0):
+        self.keys = list(content)
+        self.texts = list(content.values())
+        self.title_weight = title_weight
+        self.body = BM25Index(self.texts)
+        # Cleaned documents start with the title on their own line
+        self.titles = BM25Index([text.split("\n", 1)[0] for text in self.texts])
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, n_results: int = 5) -> List[str]:
+        scores = self.body.scores(query)
+        for doc_id, score in self.titles.scores(query).items():
+            scores[doc_id] += self.title_weight * score
+        best = heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+        return [self.texts[doc_id] for doc_id, _ in best]
 
 class SimpleRAG:
-    def __init__(self):
-        """Initialize simple RAG without vector database"""
+    def __init__(self, base_url: Optional[str] = None, store_path: Optional[str] = None):
+        """Initialize simple RAG without vector database.
+
+        store_path overrides WP_CONTENT_DB; an empty string keeps content in memory only.
+        """
         self.content_cache = {}
+        self.index = ContentIndex({})
         self.last_fetch = 0
-        self.fetch_interval = 3600  # Refetch every hour
+        self.fetch_interval = float(os.getenv("WP_REFRESH_INTERVAL", "3600"))  # Refetch every hour
+        # Paginated, pooled fetcher; WP_BASE_URL can point at wp_stub_server.py for offline runs
+        self.fetcher = WordPressFetcher(
+            base_url or os.getenv("WP_BASE_URL", DEFAULT_BASE_URL),
+            max_workers=int(os.getenv("WP_FETCH_WORKERS", "4"))
+        )
+        # Incremental sync state: cleaned documents by (content_type, id) and
+        # the newest modified_gmt seen; a periodic full sync catches deletions
+        self.documents = {}
+        self.watermark = None
+        self.last_full_sync = 0
+        self.incremental = os.getenv("WP_INCREMENTAL_SYNC", "true").lower() == "true"
+        self.full_sync_interval = float(os.getenv("WP_FULL_SYNC_HOURS", "24")) * 3600
+        # Processes for HTML cleaning on large syncs (1 = inline, 0 = up to 4 by CPU count)
+        self.clean_workers = int(os.getenv("WP_CLEAN_WORKERS", "1"))
+        # Background refresh: one at a time per process, retried no more often than retry_interval
+        self.retry_interval = float(os.getenv("WP_REFRESH_RETRY_SECONDS", "60"))
+        # Durable copy shared by every worker on the host (empty WP_CONTENT_DB disables)
+        self.store_path = store_path if store_path is not None else os.getenv("WP_CONTENT_DB", DEFAULT_CONTENT_DB)
+        self._store = None
+        self.last_attempt = 0
+        self.last_failure = 0
+        self._refresh_lock = None
+        self._refresh_lock_pid = None
+        self.metrics = {
+            "refreshes": 0,
+            "failures": 0,
+            "last_error": None,
+            "last_refresh_seconds": None,
+            "max_refresh_seconds": None,
+            "staleness_at_refresh": None,
+            "served_stale": 0
+        }
     
     def clean_html_content(self, html_content: str) -> str:
         """Clean HTML content and extract meaningful text"""
-        if not html_content:
-            return ""
-        
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
+        return clean_html(html_content)
+    
+    def fetch_wordpress_content(self) -> Dict[str, str]:
+        """Return cached WordPress content, refreshing it in the background once stale.
+
+        A cold process loads the content store first and only waits on the
+        network when the store is empty. Otherwise the current content is
+        returned at once and an expired TTL starts a single background
+        refresh (stale-while-revalidate); concurrent callers never start another.
+        """
+        if not self.content_cache:
+            with self._get_refresh_lock():
+                if not self.content_cache and not self._load_from_store():
+                    # Nothing stored yet either, so wait for the one refresh
+                    self._refresh(wait=True)
         
-        # Get text and clean it
-        text = soup.get_text()
+        if self.content_cache and time.time() - self.last_fetch >= self.fetch_interval:
+            self.metrics["served_stale"] += 1
+            self._start_refresh()
+        return self.content_cache
+    
+    def load_fresh(self) -> Dict:
+        """Blocking variant for offline jobs: the stored documents, synced first if older than the TTL.
+
+        Returns the cleaned documents keyed by (content_type, id).
+        """
+        with self._get_refresh_lock():
+            self._refresh(wait=True)
+        return self.documents
+
+    def _get_refresh_lock(self) -> threading.Lock:
+        # A lock held by a refresh thread at fork time would stay held in the
+        # child forever, so each process gets its own
+        if self._refresh_lock_pid != os.getpid():
+            self._refresh_lock = threading.Lock()
+            self._refresh_lock_pid = os.getpid()
+        return self._refresh_lock
+    
+    def _start_refresh(self):
+        """Start a background refresh unless one is running or the last attempt just failed"""
+        if time.time() - self.last_failure < self.retry_interval:
+            return
+        lock = self._get_refresh_lock()
+        if not lock.acquire(blocking=False):
+            return
         
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
+        def run():
+            try:
+                self._refresh()
+            finally:
+                lock.release()
         
-        return text
+        threading.Thread(target=run, name="wp-refresh", daemon=True).start()
     
-    def fetch_wordpress_content(self) -> Dict[str, str]:
-        """Fetch and cache WordPress content"""
-        current_time = time.time()
-        
-        # Return cached content if recent
-        if self.content_cache and (current_time - self.last_fetch) < self.fetch_interval:
-            return self.content_cache
+    def _get_store(self) -> Optional[ContentStore]:
+        if self._store is None and self.store_path:
+            try:
+                self._store = ContentStore(self.store_path)
+            except Exception as e:
+                print(f"⚠️ Content store unavailable, keeping content in memory only: {str(e)}")
+                self.store_path = None
+        return self._store
+    
+    def _load_from_store(self) -> bool:
+        """Adopt the stored documents if another process (or a previous run) saved newer ones"""
+        store = self._get_store()
+        if store is None:
+            return False
+        try:
+            meta = store.load_meta()
+            if meta.get("base_url") != self.fetcher.base_url:
+                # Filled from another site (or before the site was recorded): treat as empty
+                return False
+            stored_fetch = float(meta.get("last_fetch", 0))
+            if stored_fetch <= self.last_fetch:
+                return False
+            if self.documents and meta.get("last_full_sync") == str(self.last_full_sync):
+                # Same full-sync generation: only rows changed since our watermark are new
+                documents = dict(self.documents)
+                documents.update(store.load_documents(modified_since=self.watermark))
+            else:
+                documents = store.load_documents()
+        except Exception as e:
+            print(f"⚠️ Could not read content store: {str(e)}")
+            return False
         
+        self._publish(documents)
+        self.watermark = meta.get("watermark") or None
+        self.last_full_sync = float(meta.get("last_full_sync", 0))
+        self.last_fetch = stored_fetch
+        print(f"📦 Loaded {len(self.content_cache)} content pieces from the content store")
+        return True
+    
+    def _refresh(self, wait: bool = False):
+        """Refresh once per host: take the store's refresh lock, adopt a refresh
+        another worker just finished, or else sync from the site"""
+        store = self._get_store()
+        if store is None:
+            self._sync_and_record()
+            return
+        with store.refresh_lock(blocking=wait) as lock:
+            if not lock.acquired:
+                # Another worker is refreshing; a later call picks its result up from the store
+                return
+            if self._load_from_store() and time.time() - self.last_fetch < self.fetch_interval:
+                return
+            self._sync_and_record()
+    
+    def _sync_and_record(self):
+        """Run one sync and record its duration and how stale the content had become"""
+        start = time.time()
+        self.last_attempt = start
+        staleness = round(start - self.last_fetch, 1) if self.last_fetch else None
         print("🔄 Fetching fresh WordPress content...")
+        try:
+            stats = self.sync()
+        except Exception as e:
+            self.metrics["failures"] += 1
+            self.metrics["last_error"] = str(e)
+            self.last_failure = time.time()
+            print(f"❌ WordPress refresh failed, serving cached content: {str(e)}")
+            return
         
-        urls = [
-            "https://www.onpalms.com/wp-json/wp/v2/pages?per_page=100",
-            "https://www.onpalms.com/wp-json/wp/v2/posts?per_page=100"
-        ]
+        seconds = time.time() - start
+        self.metrics["refreshes"] += 1
+        self.metrics["last_refresh_seconds"] = round(seconds, 3)
+        self.metrics["max_refresh_seconds"] = round(max(seconds, self.metrics["max_refresh_seconds"] or 0), 3)
+        self.metrics["staleness_at_refresh"] = staleness
+        if stats["errors"]:
+            # Partial result: keep it, but try again after retry_interval
+            self.metrics["failures"] += 1
+            self.metrics["last_error"] = f"{stats['errors']} page request(s) failed"
+            self.last_failure = time.time()
+    
+    def stats(self) -> Dict:
+        """Refresh metrics plus the current age of the cached content"""
+        return {
+            **self.metrics,
+            "documents": len(self.content_cache),
+            "refreshing": self._get_refresh_lock().locked(),
+            "staleness_seconds": round(time.time() - self.last_fetch, 1) if self.last_fetch else None,
+            "ttl_seconds": self.fetch_interval,
+            "store": self.store_path or None
+        }
+    
+    def sync(self) -> Dict:
+        """Bring the cached documents up to date with the site and return sync stats.
+
+        The first sync, and then one every WP_FULL_SYNC_HOURS (which also drops
+        deleted items), downloads and cleans everything. In between, only items
+        modified after the watermark are requested, with If-None-Match, and
+        only items whose modified_gmt changed are cleaned again.
+        """
+        start = time.time()
+        full = not self.incremental or self.watermark is None or start - self.last_full_sync >= self.full_sync_interval
+        params = None
+        if not full:
+            # One second of overlap so an edit saved in the same second as the
+            # watermark is not missed; unchanged items in it are skipped below
+            after = datetime.strptime(self.watermark[:19], "%Y-%m-%dT%H:%M:%S") - timedelta(seconds=1)
+            params = {"modified_after": after.strftime("%Y-%m-%dT%H:%M:%S") + "+00:00"}
         
-        all_content = {}
+        # Every page of both collections, fetched concurrently
+        collections = self.fetcher.fetch_all(["pages", "posts"], params=params, conditional=not full)
+        errors = self.fetcher.errors
         
-        for url in urls:
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                
-                data = response.json()
-                content_type = "pages" if "pages" in url else "posts"
-                
-                for item in data:
-                    title = self.clean_html_content(item.get("title", {}).get("rendered", ""))
-                    content = self.clean_html_content(item.get("content", {}).get("rendered", ""))
-                    excerpt = self.clean_html_content(item.get("excerpt", {}).get("rendered", ""))
-                    
-                    full_text = f"{title}\n{excerpt}\n{content}".strip()
-                    
-                    if full_text and len(full_text) > 50:
-                        key = f"{content_type}_{item['id']}_{title[:30]}"
-                        all_content[key] = full_text
-                
-                print(f"✅ Fetched {len(data)} {content_type}")
-                time.sleep(0.5)  # Be respectful
-                
-            except Exception as e:
-                print(f"❌ Error fetching {url}: {str(e)}")
-                continue
+        # A failed full sync merges into what we had instead of dropping it
+        documents = {} if full and not errors else dict(self.documents)
+        to_clean = []
+        for content_type, data in collections.items():
+            for item in data:
+                previous = self.documents.get((content_type, item["id"]))
+                if not full and previous is not None and previous["modified_gmt"] == item.get("modified_gmt", ""):
+                    continue
+                to_clean.append((content_type, item))
+            
+            print(f"✅ Fetched {len(data)} {content_type}")
         
-        self.content_cache = all_content
-        self.last_fetch = current_time
+        # One batch, so a full sync of a large site can use the process pool
+        updated = {}
+        for (content_type, item), doc in zip(to_clean, clean_items(to_clean, self.clean_workers)):
+            updated[(content_type, item["id"])] = doc
+        documents.update(updated)
+        changed = len(updated)
         
-        print(f"✅ Cached {len(all_content)} content pieces")
-        return all_content
+        self._publish(documents)
+        if not errors:
+            # Only advance once everything up to the new watermark has been seen
+            self.watermark = max((doc["modified_gmt"] for doc in documents.values()), default=self.watermark)
+            if full:
+                self.last_full_sync = start
+            self.last_fetch = start
+        self._persist(updated, replace=full and not errors, complete=not errors)
+        
+        stats = {
+            "mode": "full" if full else "incremental",
+            "changed": changed,
+            "documents": len(documents),
+            "requests": self.fetcher.requests,
+            "not_modified": self.fetcher.not_modified,
+            "errors": errors,
+            "seconds": round(time.time() - start, 3)
+        }
+        print(f"✅ Cached {len(self.content_cache)} content pieces "
+              f"({stats['mode']} sync: {changed} changed, {stats['not_modified']}/{stats['requests']} pages not modified)")
+        return stats
+    
+    def _publish(self, documents: Dict):
+        """Swap in a new document set and the searchable content derived from it"""
+        self.documents = documents
+        content = {
+            doc["key"]: doc["text"] for doc in documents.values() if doc["text"] and len(doc["text"]) > 50
+        }
+        # Tokenized once here, so queries never rescan the corpus
+        self.index = ContentIndex(content)
+        self.content_cache = content
+    
+    def _persist(self, updated: Dict, replace: bool, complete: bool):
+        """Write changed documents, and the sync state when the sync was complete, to the store"""
+        store = self._get_store()
+        if store is None:
+            return
+        meta = {}
+        if complete:
+            meta = {"watermark": self.watermark or "", "last_full_sync": self.last_full_sync,
+                    "last_fetch": self.last_fetch, "base_url": self.fetcher.base_url}
+        try:
+            # A full sync takes the store over; changes alone never go into another site's documents
+            if not replace and store.load_meta().get("base_url") != self.fetcher.base_url:
+                return
+            store.save(self.documents if replace else updated, meta, replace=replace)
+        except Exception as e:
+            print(f"⚠️ Could not write content store: {str(e)}")
     
     def simple_search(self, query: str, n_results: int = 5) -> List[str]:
-        """Simple keyword-based search"""
+        """BM25 keyword search over the cached website content"""
         content = self.fetch_wordpress_content()
         
         if not content:
             return ["PALMS™ is a comprehensive warehouse management system designed to optimize your operations."]
         
-        query_lower = query.lower()
-        scored_results = []
-        
-        for key, text in content.items():
-            text_lower = text.lower()
-            
-            # Simple scoring based on keyword matches
-            score = 0
-            
-            # Score based on query words appearing in content
-            query_words = query_lower.split()
-            for word in query_words:
-                if len(word) > 2:  # Skip very short words
-                    score += text_lower.count(word) * len(word)
-            
-            # Boost score if words appear in title area (first 100 chars)
-            title_area = text_lower[:100]
-            for word in query_words:
-                if len(word) > 2 and word in title_area:
-                    score += 10
-            
-            if score > 0:
-                scored_results.append((score, text))
-        
-        # Sort by score and return top results
-        scored_results.sort(key=lambda x: x[0], reverse=True)
-        
-        results = [text for score, text in scored_results[:n_results]]
+        results = self.index.search(query, n_results)
         
         # If no good matches, return some general content
-        if not results and content:
-            results = list(content.values())[:n_results]
+        if not results:
+            results = self.index.texts[:n_results]
         
         return results
 
@@ -0,0 +1,231 @@
+"""
+Interchangeable vector index backends for knowledgebase retrieval
+
+All backends score L2-normalized vectors by inner product (cosine similarity)
+and return (ids, scores) arrays of shape (n_queries, top_k), best first.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+BACKENDS = ('numpy', 'faiss-flat', 'faiss-ivf', 'faiss-hnsw')
+
+class CompactEmbeddings:
+    """Reduced-precision copy of the section matrix used for the first-pass scan.
+
+    float16 halves and int8 quarters the resident size of the float32 matrix.
+    int8 codes use one symmetric scale per row, so a row's score is the int8
+    dot product times that row's scale.
+    """
+
+    BLOCK_ROWS = 256
+    DTYPES = ('float16', 'int8')
+
+    def __init__(self, matrix: np.ndarray, dtype: str = 'int8'):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        self.dtype = dtype
+        matrix = np.asarray(matrix, dtype=np.float32)
+
+        if dtype == 'float16':
+            self.codes = matrix.astype(np.float16)
+            self.scales = None
+        else:
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.codes = np.round(matrix / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarities of shape (n_queries, n_rows)"""
+        queries = np.asarray(queries, dtype=np.float32)
+        out = np.empty((queries.shape[0], self.codes.shape[0]), dtype=np.float32)
+
+        # Upcast one block at a time so the temporary float32 copy stays small
+        for start in range(0, self.codes.shape[0], self.BLOCK_ROWS):
+            block = self.codes[start:start + self.BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+def _select_top(scores: np.ndarray, k: int):
+    """Return (indices, scores) of the k best columns per row, best first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    # Partial selection of the k columns per row, then order just those
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+def search_embeddings(queries: np.ndarray, embeddings: np.ndarray, top_k: int,
+                      compact: Optional[CompactEmbeddings] = None, rerank_factor: int = 4):
+    """Top-k search of normalized query vectors against normalized section vectors.
+
+    Without a compact store this is an exact brute-force scan. With one, the
+    compact codes pick top_k * rerank_factor candidates and only those rows of
+    the full-precision matrix are read to compute exact scores.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if compact is None:
+        return _select_top(queries @ embeddings.T, top_k)
+
+    candidates, _ = _select_top(compact.scores(queries), top_k * rerank_factor)
+    exact = np.einsum('qd,qcd->qc', queries, np.asarray(embeddings[candidates], dtype=np.float32))
+    local, exact_scores = _select_top(exact, top_k)
+    return np.take_along_axis(candidates, local, axis=1), exact_scores
+
+class VectorIndex:
+    """Base class: a searchable view over a fixed matrix of normalized vectors"""
+
+    name = 'base'
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def save(self, path: str):
+        """Persist whatever the backend cannot cheaply rebuild (no-op by default)"""
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray, **options) -> Optional['VectorIndex']:
+        """Restore a persisted index, or None if there is nothing usable at path"""
+        return None
+
+    def describe(self) -> str:
+        return self.name
+
+class NumpyIndex(VectorIndex):
+    """Exact brute-force scan, optionally over a float16/int8 first-pass store"""
+
+    name = 'numpy'
+
+    def __init__(self, embeddings: np.ndarray, store: str = 'float32', rerank_factor: int = 4):
+        super().__init__(embeddings)
+        self.store = store
+        self.rerank_factor = rerank_factor
+        self.compact = CompactEmbeddings(embeddings, store) if store != 'float32' else None
+
+    def search(self, queries: np.ndarray, top_k: int):
+        return search_embeddings(queries, self.embeddings, top_k,
+                                 compact=self.compact, rerank_factor=self.rerank_factor)
+
+    def describe(self) -> str:
+        return f"numpy ({self.store})"
+
+class FaissIndex(VectorIndex):
+    """FAISS flat, IVF or HNSW index over inner product"""
+
+    def __init__(self, embeddings: np.ndarray, kind: str = 'flat', index=None,
+                 nprobe: int = 16, ef_search: int = 64):
+        import faiss
+
+        super().__init__(embeddings)
+        self.kind = kind
+        self.name = f"faiss-{kind}"
+        self.index = index if index is not None else self._build(faiss, kind)
+        self._tune(faiss, nprobe, ef_search)
+
+    def _build(self, faiss, kind: str):
+        vectors = np.ascontiguousarray(self.embeddings, dtype=np.float32)
+        n, dim = vectors.shape
+
+        if kind == 'flat':
+            index = faiss.IndexFlatIP(dim)
+        elif kind == 'ivf':
+            # About sqrt(n) lists, capped so each centroid trains on ~40 points
+            nlist = max(1, min(n // 40, int(np.sqrt(n))))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+        elif kind == 'hnsw':
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 80
+        else:
+            raise ValueError(f"Unknown FAISS index kind: {kind}")
+
+        index.add(vectors)
+        return index
+
+    def _tune(self, faiss, nprobe: int, ef_search: int):
+        if self.kind == 'ivf':
+            self.index.nprobe = nprobe
+        elif self.kind == 'hnsw':
+            self.index.hnsw.efSearch = ef_search
+
+    def search(self, queries: np.ndarray, top_k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        top_k = min(top_k, self.index.ntotal)
+        scores, ids = self.index.search(queries, top_k)
+        # FAISS pads with -1 when a probe finds fewer than top_k neighbours
+        if (ids < 0).any():
+            keep = [row >= 0 for row in ids]
+            width = min(int(k.sum()) for k in keep)
+            ids = np.stack([row[k][:width] for row, k in zip(ids, keep)])
+            scores = np.stack([row[k][:width] for row, k in zip(scores, keep)])
+        return ids.astype(np.int64), scores
+
+    def save(self, path: str):
+        import faiss
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray, kind: str = 'flat', **options):
+        import faiss
+        if not os.path.exists(path):
+            return None
+        index = faiss.read_index(path)
+        if index.ntotal != embeddings.shape[0] or index.d != embeddings.shape[1]:
+            return None
+        return cls(embeddings, kind=kind, index=index, **options)
+
+def _remove_stale_indexes(cache_dir: str, backend: str, keep: str):
+    """Delete persisted indexes of this backend built for older corpus versions"""
+    for name in os.listdir(cache_dir):
+        if name.endswith(f".{backend}.faiss") and name != keep:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+def create_index(embeddings: np.ndarray, backend: str = 'numpy', cache_dir: Optional[str] = None,
+                 version: str = '', store: str = 'float32', rerank_factor: int = 4) -> VectorIndex:
+    """Build (or load the persisted copy of) the index selected by backend.
+
+    FAISS indexes are written next to the embedding cache under a name that
+    includes the corpus version, so they are rebuilt exactly when the corpus
+    changes. If faiss is not installed the exact numpy backend is used instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector index backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    if backend.startswith('faiss-'):
+        kind = backend.split('-', 1)[1]
+        options = {'nprobe': int(os.getenv('KB_FAISS_NPROBE', '16')),
+                   'ef_search': int(os.getenv('KB_FAISS_EF_SEARCH', '64'))}
+        try:
+            path = os.path.join(cache_dir, f"{version}.{backend}.faiss") if cache_dir else None
+            index = FaissIndex.load(path, embeddings, kind=kind, **options) if path else None
+            if index is None:
+                index = FaissIndex(embeddings, kind=kind, **options)
+                if path:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    index.save(path)
+                    _remove_stale_indexes(cache_dir, backend, keep=os.path.basename(path))
+            return index
+        except ImportError:
+            print("⚠️ faiss is not installed, falling back to the numpy index")
+
+    return NumpyIndex(embeddings, store=store, rerank_factor=rerank_factor)
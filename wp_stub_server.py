@@ -0,0 +1,196 @@
+"""
+Local stand-in for the WordPress REST API, for testing and benchmarking offline
+
+Serves /wp-json/wp/v2/pages and /wp-json/wp/v2/posts with generated
+content, WordPress-style pagination (per_page, page, X-WP-Total,
+X-WP-TotalPages), the modified_after filter, _fields projection, gzip
+responses, ETag / If-None-Match revalidation and an artificial
+per-request latency. Items carry the usual REST extras (_links,
+yoast_head, guid, ...) so payload sizes are realistic.
+
+Usage:
+    python wp_stub_server.py [--port 8090] [--pages 40] [--posts 250] [--latency-ms 150]
+then point the chatbot at it with WP_BASE_URL=http://127.0.0.1:8090
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+TOPICS = [
+    ("Warehouse Management", "PALMS™ WMS tracks inventory in real time across multiple warehouses."),
+    ("3PL Billing", "Automated 3PL billing captures storage, handling and value-added services per client."),
+    ("RFID and Barcode Scanning", "Mobile scanners and RFID readers confirm every pick, pack and putaway."),
+    ("FEFO Rotation", "First-expiry-first-out rules keep perishable stock moving before it expires."),
+    ("Analytics", "Dashboards report KPIs, throughput and labour productivity as they happen."),
+    ("Integrations", "Connectors link PALMS™ with ERP, e-commerce and carrier systems."),
+]
+
+def generate_items(content_type: str, count: int) -> List[Dict]:
+    """Deterministic WP-shaped items with HTML bodies of realistic size"""
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(count):
+        topic, sentence = TOPICS[i % len(TOPICS)]
+        title = f"{topic} {content_type[:-1]} {i + 1}"
+        paragraphs = "".join(f"<p>{sentence} Section {n + 1} of {title}.</p>\n" for n in range(12))
+        modified = (base + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S')
+        item_id = (1000 if content_type == "pages" else 5000) + i
+        slug = title.lower().replace(" ", "-")
+        api = f"https://www.onpalms.com/wp-json/wp/v2/{content_type}/{item_id}"
+        items.append({
+            "id": item_id,
+            "date_gmt": modified,
+            "modified_gmt": modified,
+            "slug": slug,
+            "link": f"https://www.onpalms.com/{slug}/",
+            "title": {"rendered": title},
+            "excerpt": {"rendered": f"<p>{sentence}</p>\n"},
+            "content": {"rendered": f"<div class=\"entry\">\n<h2>{topic}</h2>\n{paragraphs}"
+                                    f"<script>trackView({i});</script>\n<style>.entry{{margin:0}}</style>\n</div>"},
+            # Fields ingestion never reads
+            "guid": {"rendered": f"https://www.onpalms.com/?p={i}"},
+            "author": 1, "featured_media": 0, "status": "publish", "type": content_type[:-1],
+            "categories": [1, 2], "tags": [], "meta": {"footnotes": ""},
+            "class_list": [f"{content_type[:-1]}-{i}", "type-" + content_type[:-1], "status-publish", "hentry"],
+            "yoast_head": "".join(f"<meta property=\"og:{k}\" content=\"{title} | PALMS™ warehouse management\" />\n"
+                                  for k in ("title", "description", "site_name", "url", "type", "locale")) * 6,
+            "yoast_head_json": {"title": title, "robots": {"index": "index", "follow": "follow"},
+                                "og_url": f"https://www.onpalms.com/{slug}/", "schema": {"@graph": [{"@type": "WebPage",
+                                "name": title, "description": sentence}] * 4}},
+            "_links": {rel: [{"href": f"{api}/{rel}"}] for rel in
+                       ("self", "collection", "about", "author", "replies", "version-history", "wp:attachment", "curies")},
+        })
+    return items
+
+class StubWordPress:
+    """In-process stub server; use as a context manager or call start()/stop()"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, pages: int = 40, posts: int = 250,
+                 latency_ms: float = 150.0):
+        self.collections = {"pages": generate_items("pages", pages), "posts": generate_items("posts", posts)}
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                status, headers, body = stub.respond(urlparse(self.path), self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub._lock:
+                    stub.bytes_sent += len(body)
+                    stub.not_modified += status == 304
+
+        return Handler
+
+    def respond(self, url, headers):
+        """Return (status, headers, body) for a parsed request URL"""
+        prefix = "/wp-json/wp/v2/"
+        content_type = url.path[len(prefix):].strip("/") if url.path.startswith(prefix) else None
+        if content_type not in self.collections:
+            return 404, {"Content-Type": "application/json"}, b'{"code":"rest_no_route"}'
+
+        query = parse_qs(url.query)
+        per_page = min(int(query.get("per_page", ["10"])[0]), 100)
+        page = int(query.get("page", ["1"])[0])
+        items = self.collections[content_type]
+        if "modified_after" in query:
+            # Timestamps are UTC; compare on the first 19 characters (no offset)
+            after = query["modified_after"][0][:19]
+            items = [item for item in items if item["modified_gmt"] > after]
+
+        total_pages = max(1, math.ceil(len(items) / per_page))
+        if page > total_pages:
+            return 400, {"Content-Type": "application/json"}, b'{"code":"rest_post_invalid_page_number"}'
+
+        selected = items[(page - 1) * per_page:page * per_page]
+        if "_fields" in query:
+            fields = query["_fields"][0].split(",")
+            selected = [{k: item[k] for k in fields if k in item} for item in selected]
+        body = json.dumps(selected).encode("utf-8")
+        response_headers = {
+            "Content-Type": "application/json; charset=UTF-8",
+            "X-WP-Total": str(len(items)),
+            "X-WP-TotalPages": str(total_pages),
+            "ETag": f"\"{hashlib.md5(body).hexdigest()}\"",
+        }
+        if headers.get("If-None-Match") == response_headers["ETag"]:
+            return 304, {"ETag": response_headers["ETag"]}, b""
+        if "gzip" in headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            response_headers["Content-Encoding"] = "gzip"
+            response_headers["Vary"] = "Accept-Encoding"
+        return 200, response_headers, body
+
+    def touch(self, content_type: str, index: int, text: str = "Updated"):
+        """Edit one item as if saved in wp-admin: new content and modified_gmt of now"""
+        item = self.collections[content_type][index]
+        item["content"]["rendered"] += f"\n<p>{text}</p>"
+        item["modified_gmt"] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="wp-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in WordPress REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--posts", type=int, default=250)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    stub = StubWordPress(args.host, args.port, args.pages, args.posts, args.latency_ms)
+    print(f"🧪 Stub WordPress on {stub.url} ({args.pages} pages, {args.posts} posts, {args.latency_ms:.0f}ms latency)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()